@@ -0,0 +1,301 @@
+##################################################################################################
+# asyncio client for the USB-CAN Analyzer V7, so one event loop can drive many adapters (and
+# any network I/O) without a thread per port.
+#
+#     async with AsyncCan.AsyncBus("/dev/ttyUSB0", serial_baud=2000000) as bus:
+#         await bus.send(0x123, b'\x01\x02')
+#         async for packet in bus:
+#             ...
+#
+# The port is opened and configured by a USBCanAnalyzerV7.DeviceInterface, which then only
+# serves as the framer and frame encoder: SerialFdTransport watches the port's file descriptor
+# with loop.add_reader() and hands every chunk read to V7Protocol, which frames it with
+# DeviceInterface.rx_frame_chunk(). Nothing ever blocks on the port.
+#
+# Sending goes through a bounded queue, so send() waits once TX_QUEUE_MAX_FRAMES frames are
+# pending. A writer task drains the queue, writing everything queued as one chunk, and stops
+# while the transport's write buffer is above its high water mark (i.e. the adapter is not
+# keeping up).
+#
+# POSIX only: pySerial's posix backend keeps the port non-blocking and exposes its fd.
+##################################################################################################
+import asyncio
+import collections
+import os
+import logging
+
+import serial
+import USBCanAnalyzerV7
+
+async_log = logging.getLogger(__name__)
+
+
+class SerialFdTransport(asyncio.Transport):
+    # Minimal read/write transport over an open pySerial port's file descriptor. The port
+    # stays owned by the caller; closing the transport only stops watching it.
+    MAX_READ_SIZE = 65536
+    WRITE_HIGH_WATER_DEFAULT = 16384
+
+    def __init__(self, loop, sp, protocol):
+        asyncio.Transport.__init__(self, {'serial': sp})
+        self.loop = loop
+        self.sp = sp
+        self.fd = sp.fileno()
+        self.protocol = protocol
+        self.write_buffer = bytearray()
+        self.closing = False
+        self.protocol_paused = False
+        self.set_write_buffer_limits()
+        self.loop.add_reader(self.fd, self.read_ready)
+        self.loop.call_soon(self.protocol.connection_made, self)
+
+    def read_ready(self):
+        try:
+            data = os.read(self.fd, self.MAX_READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.fatal_error(e)
+            return
+        if(data):
+            self.protocol.data_received(data)
+        else:
+            # Readable yet empty: the device went away (e.g. USB adapter unplugged)
+            self.fatal_error(serial.SerialException("device reports readiness to read but returned no data"))
+
+    def write(self, data):
+        if(self.closing or not data):
+            return
+        if(not self.write_buffer):
+            # Try writing straight away, only buffer what the port does not take
+            try:
+                written = os.write(self.fd, data)
+            except (BlockingIOError, InterruptedError):
+                written = 0
+            except OSError as e:
+                self.fatal_error(e)
+                return
+            if(written == len(data)):
+                return
+            data = memoryview(data)[written:]
+            self.loop.add_writer(self.fd, self.write_ready)
+        self.write_buffer += data
+        if(not self.protocol_paused and len(self.write_buffer) > self.write_high_water):
+            self.protocol_paused = True
+            self.protocol.pause_writing()
+
+    def write_ready(self):
+        try:
+            written = os.write(self.fd, self.write_buffer)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as e:
+            self.fatal_error(e)
+            return
+        del self.write_buffer[:written]
+        if(self.protocol_paused and len(self.write_buffer) <= self.write_low_water):
+            self.protocol_paused = False
+            self.protocol.resume_writing()
+        if(not self.write_buffer):
+            self.loop.remove_writer(self.fd)
+            if(self.closing):
+                self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def get_write_buffer_size(self):
+        return len(self.write_buffer)
+
+    def get_write_buffer_limits(self):
+        return (self.write_low_water, self.write_high_water)
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        if(high is None):
+            high = self.WRITE_HIGH_WATER_DEFAULT if low is None else 4 * low
+        if(low is None):
+            low = high // 4
+        if(not high >= low >= 0):
+            raise ValueError("high (%r) must be >= low (%r) must be >= 0" % (high, low))
+        self.write_high_water = high
+        self.write_low_water = low
+
+    def is_closing(self):
+        return self.closing
+
+    def close(self):
+        # Stop reading now, finish writing what is buffered
+        if(self.closing):
+            return
+        self.closing = True
+        self.loop.remove_reader(self.fd)
+        if(not self.write_buffer):
+            self.loop.call_soon(self.protocol.connection_lost, None)
+
+    def abort(self):
+        self.fatal_error(None)
+
+    def fatal_error(self, exc):
+        if(exc is not None):
+            async_log.error("Serial port %s failed: %s", self.sp.port, exc)
+        self.loop.remove_reader(self.fd)
+        self.loop.remove_writer(self.fd)
+        self.write_buffer.clear()
+        if(not self.closing):
+            self.closing = True
+            self.loop.call_soon(self.protocol.connection_lost, exc)
+
+
+class V7Protocol(asyncio.Protocol):
+    # Frames the adapter byte stream into CanPackets and queues them for the reader.
+    # Like DeviceInterface's RX thread queue, the oldest packets are dropped (and counted in
+    # rx_stats.queue_dropped) if nobody reads them.
+    RX_QUEUE_MAX_PACKETS = 100000
+
+    def __init__(self, device):
+        self.device = device
+        self.rx_queue = collections.deque(maxlen=self.RX_QUEUE_MAX_PACKETS)
+        self.rx_ready = asyncio.Event()
+        self.can_write = asyncio.Event()
+        self.can_write.set()
+        self.closed = False
+        self.close_exc = None
+
+    def data_received(self, data):
+        packet_list = []
+        self.device.rx_frame_chunk(data, packet_list)
+        if(packet_list):
+            free_slots = self.rx_queue.maxlen - len(self.rx_queue)
+            if(len(packet_list) > free_slots):
+                self.device.rx_stats.queue_dropped += len(packet_list) - free_slots
+            self.rx_queue.extend(packet_list)
+            self.rx_ready.set()
+
+    def pause_writing(self):
+        self.can_write.clear()
+
+    def resume_writing(self):
+        self.can_write.set()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.close_exc = exc
+        # Wake up anyone waiting so they see the port is gone
+        self.rx_ready.set()
+        self.can_write.set()
+
+    async def next_packets(self):
+        # Everything received so far, waiting for at least one packet. [] once the port is closed.
+        while(not self.rx_queue):
+            if(self.closed):
+                if(self.close_exc is not None):
+                    raise self.close_exc
+                return []
+            self.rx_ready.clear()
+            await self.rx_ready.wait()
+        packet_list = list(self.rx_queue)
+        self.rx_queue.clear()
+        return packet_list
+
+
+class AsyncBus:
+    TX_QUEUE_MAX_FRAMES = 256
+
+    def __init__(self, comport, speed_kbps=1024, use_extended_frame=True,
+                 serial_baud=USBCanAnalyzerV7.DeviceInterface.SERIAL_BAUD_DEFAULT, channel=0, filters=None):
+        self.device = USBCanAnalyzerV7.DeviceInterface(speed_kbps, use_extended_frame, comport,
+                                                       serial_baud=serial_baud, channel=channel)
+        if(filters is not None):
+            self.device.set_filters(filters)
+        self.transport = None
+        self.protocol = None
+        self.tx_queue = None
+        self.tx_task = None
+        # Packets from the last next_packets() call not yet handed out by __anext__
+        self.rx_pending = collections.deque()
+
+    async def open(self):
+        if(self.transport is not None):
+            async_log.warning("Bus already open!")
+            return
+        loop = asyncio.get_running_loop()
+        # Opens the port and writes the config packet (a few bytes, it does not block)
+        self.device.open()
+        self.protocol = V7Protocol(self.device)
+        self.transport = SerialFdTransport(loop, self.device.sp, self.protocol)
+        self.tx_queue = asyncio.Queue(maxsize=self.TX_QUEUE_MAX_FRAMES)
+        self.tx_task = loop.create_task(self.tx_writer())
+        self.rx_pending.clear()
+
+    async def close(self):
+        if(self.transport is None):
+            return
+        # Hand everything still queued to the port while it is open, then stop the writer
+        if(not self.protocol.closed and not self.tx_task.done()):
+            await self.drain()
+        self.tx_task.cancel()
+        try:
+            await self.tx_task
+        except asyncio.CancelledError:
+            pass
+        self.transport.close()
+        # Let the transport flush its write buffer before the port goes
+        while(self.transport.get_write_buffer_size() > 0 and not self.protocol.closed):
+            await asyncio.sleep(self.device.byte_time_ns * self.transport.get_write_buffer_size() / 1e9)
+        self.device.close()
+        self.transport = None
+
+    def is_open(self):
+        return self.transport is not None and not self.protocol.closed
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def send(self, id, data):
+        # Waits while TX_QUEUE_MAX_FRAMES frames are queued. Invalid frames are logged and dropped,
+        # as DeviceInterface.send() does.
+        send_buf = self.device.encode_frame(id, data)
+        if(send_buf is not None):
+            await self.tx_queue.put(send_buf)
+
+    async def drain(self):
+        # Wait until every queued frame has been handed to the port
+        await self.tx_queue.join()
+
+    async def tx_writer(self):
+        while(True):
+            chunk = await self.tx_queue.get()
+            num_frames = 1
+            # Whatever else is queued goes out in the same write
+            while(not self.tx_queue.empty()):
+                chunk += self.tx_queue.get_nowait()
+                num_frames += 1
+            await self.protocol.can_write.wait()
+            self.transport.write(chunk)
+            for _ in range(num_frames):
+                self.tx_queue.task_done()
+
+    async def receive(self):
+        # All packets received since the last call, waiting for at least one. [] once the port is closed.
+        if(self.rx_pending):
+            # Already filtered and logged
+            packet_list = list(self.rx_pending)
+            self.rx_pending.clear()
+            return packet_list
+        packet_list = await self.protocol.next_packets()
+        if(self.device.sw_filter_needed):
+            packet_list = self.device.filter_packets(packet_list)
+        self.device.log_received(packet_list)
+        return packet_list
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while(not self.rx_pending):
+            packet_list = await self.receive()
+            if(not packet_list and self.protocol.closed):
+                raise StopAsyncIteration
+            self.rx_pending.extend(packet_list)
+        return self.rx_pending.popleft()
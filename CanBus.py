@@ -0,0 +1,105 @@
+##################################################################################################
+# Common interface for CAN bus backends.
+#
+# The GUI and tools only talk to a bus through these calls, so any backend can be dropped in:
+#  -- USBCanAnalyzerV7.DeviceInterface   USB-CAN Analyzer V7 serial adapters
+#  -- SocketCan.SocketCanInterface       Linux SocketCAN (can0, vcan0, ...)
+#  -- Replay.ReplayInterface             playback of recorded logs
+#
+# IDs passed to send() may be an int, or bytes with the MSB at index 0 (as typed in the GUI).
+# receive() returns a list of USBCanAnalyzerV7.CanPacket, whose timestamps are on the
+# time.perf_counter_ns() clock, measured from capture_start_time.
+#
+# Acceptance filters are a list of (can_id, id_mask) pairs; a message is accepted if
+# (msg_id & id_mask) == (can_id & id_mask) for any of them. An empty list accepts everything.
+# Backends that cannot filter in hardware or in the kernel filter in software with
+# filter_packets().
+##################################################################################################
+import threading
+
+
+class CanBusInterface:
+
+    # Backends that keep receive counters set this to an object with a summary() method
+    # giving a one line description, e.g. USBCanAnalyzerV7.RxStats. Shown in the status bar.
+    rx_stats = None
+
+    def __init__(self):
+        self.filters = []
+        # Optional capture log writer (e.g. CaptureFile.CaptureWriter). Every packet returned
+        # by receive() is also handed to its write_packets(), and its set_start_time() is called
+        # whenever capture_start_time moves. Set with start_capture_log().
+        self.capture_writer = None
+        self.capture_lock = threading.Lock()
+
+    #####################################################################
+    # Backend API, implemented by each backend
+    #####################################################################
+
+    def open(self):
+        raise NotImplementedError('please implement open() in the CAN backend')
+
+    def close(self):
+        raise NotImplementedError('please implement close() in the CAN backend')
+
+    def is_open(self):
+        raise NotImplementedError('please implement is_open() in the CAN backend')
+
+    def send(self, id, data):
+        raise NotImplementedError('please implement send() in the CAN backend')
+
+    def send_many(self, frames):
+        # frames is an iterable of (id, data). Backends that can batch writes override this.
+        num_frames = 0
+        for id, data in frames:
+            self.send(id, data)
+            num_frames += 1
+        return num_frames
+
+    def receive(self):
+        raise NotImplementedError('please implement receive() in the CAN backend')
+
+    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud, filters=None):
+        # filters, if given, is passed on to set_filters()
+        raise NotImplementedError('please implement set_config() in the CAN backend')
+
+    def set_filters(self, filters):
+        self.filters = list(filters)
+
+    #####################################################################
+    # Shared helpers
+    #####################################################################
+
+    def filter_packets(self, packet_list):
+        # Software acceptance filtering against self.filters
+        if(not self.filters):
+            return packet_list
+        filters = [(can_id & id_mask, id_mask) for can_id, id_mask in self.filters]
+        return [packet for packet in packet_list
+                if any((packet.can_id & id_mask) == can_id for can_id, id_mask in filters)]
+
+    def start_capture_log(self, writer):
+        # Stream every received packet to writer until stop_capture_log()
+        self.stop_capture_log()
+        with self.capture_lock:
+            self.capture_writer = writer
+
+    def stop_capture_log(self):
+        with self.capture_lock:
+            if(self.capture_writer is not None):
+                self.capture_writer.close()
+                self.capture_writer = None
+
+    def capture_time_reset(self):
+        # Backends call this after moving capture_start_time (e.g. in open()), so a capture log
+        # started before that gets the time base its packets are stamped against
+        with self.capture_lock:
+            if(self.capture_writer is not None):
+                self.capture_writer.set_start_time(self.capture_start_time)
+
+    def log_received(self, packet_list):
+        # Backends call this from receive() with the packets they are about to return
+        if(self.capture_writer is not None and packet_list):
+            with self.capture_lock:
+                if(self.capture_writer is not None):
+                    self.capture_writer.write_packets(packet_list)
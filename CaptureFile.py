@@ -0,0 +1,262 @@
+##################################################################################################
+# Native binary capture log.
+#
+# Layout:
+#  -- Header, HEADER_SIZE bytes:
+#       magic "CANVCAP1", format version, header size, record size, index interval,
+#       capture start time (CanPacket.start_time_ns) and the wall clock time (ns since epoch)
+#       at that instant, and the byte offset of the index footer (0 if never closed cleanly)
+#  -- Records, RECORD_SIZE bytes each, in receive order:
+#       timestamp_ns int64, can_id uint32, dlc uint8, flags uint8, channel uint8,
+#       1 reserved byte, payload uint64 (data bytes as one little-endian int)
+#     The channel byte was reserved (zero) in the first logs, which read back as channel 0.
+#     This is the same layout as FrameStore.FRAME_DTYPE, so a log can be viewed as a NumPy
+#     array without copying.
+#  -- Index footer, written on close:
+#       for every INDEX_INTERVAL records, the first and last timestamp in that block, and for
+#       every CAN ID, the list of blocks it appears in.
+#
+# The CaptureWriter streams packets straight to disk as they are received. The CaptureReader
+# maps the file with mmap, so seeking to a time is a binary search over the block index and
+# then over the records in one block, and listing one ID only touches the blocks it is in.
+# A log left without an index (e.g. the program crashed) is still readable; the reader
+# rebuilds the index by scanning it once.
+##################################################################################################
+import struct
+import mmap
+import bisect
+
+import USBCanAnalyzerV7
+
+MAGIC = b'CANVCAP1'
+INDEX_MAGIC = b'CANVIDX1'
+FORMAT_VERSION = 1
+
+HEADER_STRUCT = struct.Struct('<8sHHHxxIqqQ')
+HEADER_SIZE = 64
+RECORD_STRUCT = struct.Struct('<qIBBBxQ')
+RECORD_SIZE = RECORD_STRUCT.size
+
+# Offset of the footer offset field in the header, patched in on close
+FOOTER_OFFSET_POS = HEADER_STRUCT.size - 8
+# Offset of the start time and wall clock time fields, patched in by set_start_time()
+START_TIME_POS = FOOTER_OFFSET_POS - 16
+
+INDEX_INTERVAL = 4096
+
+
+class CaptureWriter():
+
+    # Records are packed into this many per write() call
+    WRITE_BATCH_RECORDS = 1024
+
+    def __init__(self, fpath, start_time_ns, index_interval=INDEX_INTERVAL):
+        self.fpath = fpath
+        self.index_interval = index_interval
+        self.num_records = 0
+        self.block_times = []
+        self.id_blocks = {}
+        self.batch = bytearray(self.WRITE_BATCH_RECORDS * RECORD_SIZE)
+
+        # Wall clock time matching start_time_ns, from the session's single wall clock anchor
+        wall_time_ns = start_time_ns + USBCanAnalyzerV7.WALL_CLOCK_OFFSET_NS
+
+        self.f = open(fpath, 'wb')
+        header = bytearray(HEADER_SIZE)
+        HEADER_STRUCT.pack_into(header, 0, MAGIC, FORMAT_VERSION, HEADER_SIZE, RECORD_SIZE,
+                                index_interval, start_time_ns, wall_time_ns, 0)
+        self.f.write(header)
+
+    def set_start_time(self, start_time_ns):
+        # The bus reset its time base (it was opened after recording started). Only a log with no
+        # records yet is moved to it; one already holding packets keeps the start they were written
+        # against, as their timestamps would otherwise fall before it.
+        if(self.f is None or self.num_records > 0):
+            return
+        self.f.seek(START_TIME_POS)
+        self.f.write(struct.pack('<qq', start_time_ns, start_time_ns + USBCanAnalyzerV7.WALL_CLOCK_OFFSET_NS))
+        self.f.seek(HEADER_SIZE)
+
+    def write_packets(self, packet_list):
+        batch = self.batch
+        batch_idx = 0
+        for packet in packet_list:
+            RECORD_STRUCT.pack_into(batch, batch_idx * RECORD_SIZE, packet.rx_time_ns, packet.can_id,
+                                    packet.dlc, packet.flags, packet.channel, packet.payload)
+            self._index_record(packet.rx_time_ns, packet.can_id)
+            batch_idx += 1
+            if(batch_idx == self.WRITE_BATCH_RECORDS):
+                self.f.write(batch)
+                batch_idx = 0
+        if(batch_idx > 0):
+            self.f.write(memoryview(batch)[:batch_idx * RECORD_SIZE])
+
+    def close(self):
+        if(self.f is None):
+            return
+        footer_offset = HEADER_SIZE + self.num_records * RECORD_SIZE
+        self.f.write(pack_index(self.index_interval, self.block_times, self.id_blocks))
+        self.f.seek(FOOTER_OFFSET_POS)
+        self.f.write(struct.pack('<Q', footer_offset))
+        self.f.close()
+        self.f = None
+
+    def _index_record(self, timestamp_ns, can_id):
+        block = self.num_records // self.index_interval
+        if(block == len(self.block_times)):
+            self.block_times.append([timestamp_ns, timestamp_ns])
+        else:
+            self.block_times[block][1] = timestamp_ns
+
+        blocks = self.id_blocks.get(can_id)
+        if(blocks is None):
+            self.id_blocks[can_id] = [block]
+        elif(blocks[-1] != block):
+            blocks.append(block)
+        self.num_records += 1
+
+
+class CaptureReader():
+
+    def __init__(self, fpath):
+        self.f = open(fpath, 'rb')
+        self.mm = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, header_size, record_size, self.index_interval,
+         self.start_time_ns, self.wall_time_ns, footer_offset) = HEADER_STRUCT.unpack_from(self.mm, 0)
+        if(magic != MAGIC or version != FORMAT_VERSION or record_size != RECORD_SIZE):
+            self.close()
+            raise ValueError(fpath + " is not a supported capture log")
+        self.header_size = header_size
+
+        if(footer_offset != 0):
+            self.num_records = (footer_offset - header_size) // RECORD_SIZE
+            self.block_times, self.id_blocks = unpack_index(self.mm, footer_offset)
+        else:
+            # Not closed cleanly: use whatever whole records made it to disk
+            self.num_records = (len(self.mm) - header_size) // RECORD_SIZE
+            self._rebuild_index()
+
+        self.block_first_times = [first for first, last in self.block_times]
+
+    def __len__(self):
+        return self.num_records
+
+    def __getitem__(self, record_idx):
+        if(record_idx < 0):
+            record_idx += self.num_records
+        if(record_idx < 0 or record_idx >= self.num_records):
+            raise IndexError("record index out of range")
+        return self.get_packet(record_idx)
+
+    def get_record(self, record_idx):
+        # (timestamp_ns, can_id, dlc, flags, channel, payload)
+        return RECORD_STRUCT.unpack_from(self.mm, self.header_size + record_idx * RECORD_SIZE)
+
+    def get_packet(self, record_idx, prev_time_ns=None):
+        timestamp_ns, can_id, dlc, flags, channel, payload = self.get_record(record_idx)
+        if(prev_time_ns is None):
+            prev_time_ns = self.start_time_ns
+        return USBCanAnalyzerV7.CanPacket(self.start_time_ns, prev_time_ns, can_id, dlc, payload, flags, timestamp_ns, channel)
+
+    def iter_records(self, start_idx=0, end_idx=None):
+        # Records in [start_idx, end_idx), unpacked one index block's worth at a time
+        if(end_idx is None or end_idx > self.num_records):
+            end_idx = self.num_records
+        chunk_start = start_idx
+        while(chunk_start < end_idx):
+            chunk_end = min(chunk_start + self.index_interval, end_idx)
+            start = self.header_size + chunk_start * RECORD_SIZE
+            yield from RECORD_STRUCT.iter_unpack(self.mm[start:start + (chunk_end - chunk_start) * RECORD_SIZE])
+            chunk_start = chunk_end
+
+    def seek_time(self, timestamp_ns):
+        # Index of the first record with a timestamp >= timestamp_ns
+        block = bisect.bisect_right(self.block_first_times, timestamp_ns) - 1
+        if(block < 0):
+            return 0
+        lo = block * self.index_interval
+        hi = min(lo + self.index_interval, self.num_records)
+        while(lo < hi):
+            mid = (lo + hi) // 2
+            if(self.get_record(mid)[0] < timestamp_ns):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def time_range(self, start_ns, end_ns):
+        # Records with start_ns <= timestamp_ns < end_ns
+        return self.iter_records(self.seek_time(start_ns), self.seek_time(end_ns))
+
+    def records_for_id(self, can_id):
+        # Index and record for every frame with this ID, only visiting blocks it appears in
+        for block in self.id_blocks.get(can_id, []):
+            block_start = block * self.index_interval
+            for offset, record in enumerate(self.iter_records(block_start, block_start + self.index_interval)):
+                if(record[1] == can_id):
+                    yield block_start + offset, record
+
+    def ids(self):
+        return sorted(self.id_blocks.keys())
+
+    def as_array(self):
+        # Zero-copy NumPy view of every record, with the FrameStore dtype. Requires numpy.
+        import numpy as np
+        import FrameStore
+        return np.frombuffer(self.mm, dtype=FrameStore.FRAME_DTYPE, count=self.num_records, offset=self.header_size)
+
+    def close(self):
+        if(self.mm is not None):
+            self.mm.close()
+            self.mm = None
+        if(self.f is not None):
+            self.f.close()
+            self.f = None
+
+    def _rebuild_index(self):
+        self.block_times = []
+        self.id_blocks = {}
+        for record_idx, record in enumerate(self.iter_records()):
+            block = record_idx // self.index_interval
+            if(block == len(self.block_times)):
+                self.block_times.append([record[0], record[0]])
+            else:
+                self.block_times[block][1] = record[0]
+            blocks = self.id_blocks.get(record[1])
+            if(blocks is None):
+                self.id_blocks[record[1]] = [block]
+            elif(blocks[-1] != block):
+                blocks.append(block)
+
+
+def pack_index(index_interval, block_times, id_blocks):
+    parts = [INDEX_MAGIC, struct.pack('<II', index_interval, len(block_times))]
+    for first, last in block_times:
+        parts.append(struct.pack('<qq', first, last))
+    parts.append(struct.pack('<I', len(id_blocks)))
+    for can_id, blocks in id_blocks.items():
+        parts.append(struct.pack('<II', can_id, len(blocks)))
+        parts.append(struct.pack('<%dI' % len(blocks), *blocks))
+    return b''.join(parts)
+
+
+def unpack_index(buf, offset):
+    if(buf[offset:offset + len(INDEX_MAGIC)] != INDEX_MAGIC):
+        raise ValueError("Capture log index is corrupt")
+    offset += len(INDEX_MAGIC)
+    index_interval, num_blocks = struct.unpack_from('<II', buf, offset)
+    offset += 8
+    block_times = []
+    for _ in range(num_blocks):
+        block_times.append(list(struct.unpack_from('<qq', buf, offset)))
+        offset += 16
+    num_ids, = struct.unpack_from('<I', buf, offset)
+    offset += 4
+    id_blocks = {}
+    for _ in range(num_ids):
+        can_id, num_id_blocks = struct.unpack_from('<II', buf, offset)
+        offset += 8
+        id_blocks[can_id] = list(struct.unpack_from('<%dI' % num_id_blocks, buf, offset))
+        offset += 4 * num_id_blocks
+    return block_times, id_blocks
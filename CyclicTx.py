@@ -0,0 +1,275 @@
+##################################################################################################
+# Cyclic transmit scheduler: sends any number of periodic frames (heartbeats, simulated
+# sensors) on any CanBus backend, from one dedicated thread.
+#
+#     scheduler = CyclicTx.CyclicScheduler(device)
+#     scheduler.start()
+#     task_id = scheduler.add(0x123, b'\x01\x02', 10)      # every 10 ms
+#     scheduler.update_data(task_id, b'\x03\x04')          # takes effect on the next send
+#     scheduler.modify(task_id, period_ms=20)
+#     scheduler.remove(task_id)
+#
+# Due times are kept in a heap, so the thread only ever looks at the earliest one and sleeps
+# until then, however many tasks there are. Every task due within COALESCE_NS of that time is
+# sent in the same tick with one send_many() call, i.e. one serial write on the V7 adapter.
+# Each task is rescheduled from its due time rather than from when it was actually sent, so
+# delays do not accumulate; periods missed entirely (e.g. the port blocked) are skipped and
+# counted rather than sent in a burst.
+#
+# Modifying or removing a task does not search the heap: the task's version is bumped and
+# heap entries with an old version are dropped when they reach the top.
+##################################################################################################
+import threading
+import heapq
+import time
+import logging
+
+import USBCanAnalyzerV7
+
+cyclic_log = logging.getLogger(__name__)
+
+
+class CyclicTask:
+    # One periodic frame and its send statistics. Jitter is how far from its due time each
+    # send happened (early by up to COALESCE_NS when coalesced with an earlier task).
+
+    def __init__(self, task_id, can_id, data, period_ns, next_due_ns):
+        self.task_id = task_id
+        self.can_id = can_id
+        self.data = bytes(data)
+        self.period_ns = period_ns
+        self.next_due_ns = next_due_ns
+        self.version = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.sent = 0
+        self.missed = 0
+        self.first_sent_ns = 0
+        self.last_sent_ns = 0
+        self.jitter_sum_ns = 0
+        self.jitter_max_ns = 0
+
+    def note_sent(self, due_ns, sent_ns):
+        jitter_ns = abs(sent_ns - due_ns)
+        self.jitter_sum_ns += jitter_ns
+        self.jitter_max_ns = max(self.jitter_max_ns, jitter_ns)
+        if(self.sent == 0):
+            self.first_sent_ns = sent_ns
+        self.last_sent_ns = sent_ns
+        self.sent += 1
+
+    def achieved_rate(self):
+        # Sends per second since the first one (or since the period was last changed)
+        if(self.sent < 2):
+            return 0.0
+        return (self.sent - 1) * 1e9 / (self.last_sent_ns - self.first_sent_ns)
+
+    def mean_jitter_us(self):
+        if(self.sent == 0):
+            return 0
+        return self.jitter_sum_ns // self.sent // 1000
+
+    def max_jitter_us(self):
+        return self.jitter_max_ns // 1000
+
+    def summary(self):
+        return "%#x every %g ms: %d sent at %.1f/s (%.1f/s requested), %d missed, jitter mean %s max %s" % (
+            self.can_id, self.period_ns / 1e6, self.sent, self.achieved_rate(), 1e9 / self.period_ns,
+            self.missed, USBCanAnalyzerV7.format_us(self.mean_jitter_us()),
+            USBCanAnalyzerV7.format_us(self.max_jitter_us()))
+
+
+class CyclicScheduler:
+    # Tasks due within this of the earliest one are sent in the same write
+    COALESCE_NS = 500000
+
+    def __init__(self, device):
+        self.device = device
+        self.tasks = {}
+        # (due time, task id, task version)
+        self.heap = []
+        self.next_task_id = 1
+        # Guards tasks and heap; notified whenever the earliest due time may have changed
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+        # Number of send_many() calls made, to compare against the number of frames sent
+        self.writes = 0
+
+    def start(self):
+        if(self.thread is not None):
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="CyclicTx", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if(self.thread is None):
+            return
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.thread.join()
+        self.thread = None
+
+    def add(self, can_id, data, period_ms, start_delay_ms=0):
+        # Returns the new task's id, or None if the period or data are not valid
+        if(period_ms <= 0):
+            cyclic_log.error("Cyclic period must be positive, got %s ms", period_ms)
+            return None
+        if(len(data) > 8):
+            cyclic_log.error("Cannot send more than 8 bytes of data")
+            return None
+        with self.cond:
+            task_id = self.next_task_id
+            self.next_task_id += 1
+            due_ns = time.perf_counter_ns() + int(start_delay_ms * 1000000)
+            task = CyclicTask(task_id, can_id, data, int(period_ms * 1000000), due_ns)
+            self.tasks[task_id] = task
+            self.schedule(task)
+        return task_id
+
+    def modify(self, task_id, can_id=None, data=None, period_ms=None):
+        # Change any of a task's ID, data or period while it runs. A new period applies from
+        # the task's next send and restarts its statistics. Returns False if there is no such task.
+        if(data is not None and len(data) > 8):
+            cyclic_log.error("Cannot send more than 8 bytes of data")
+            return False
+        if(period_ms is not None and period_ms <= 0):
+            cyclic_log.error("Cyclic period must be positive, got %s ms", period_ms)
+            return False
+        with self.cond:
+            task = self.tasks.get(task_id)
+            if(task is None):
+                cyclic_log.warning("No cyclic task %s", task_id)
+                return False
+            if(can_id is not None):
+                task.can_id = can_id
+            if(data is not None):
+                task.data = bytes(data)
+            if(period_ms is not None):
+                period_ns = int(period_ms * 1000000)
+                if(period_ns != task.period_ns):
+                    # Keep the phase of the last send, but never schedule in the past
+                    last_due_ns = task.next_due_ns - task.period_ns
+                    task.next_due_ns = max(time.perf_counter_ns(), last_due_ns + period_ns)
+                    task.period_ns = period_ns
+                    task.reset_stats()
+                    self.schedule(task)
+        return True
+
+    def update_data(self, task_id, data):
+        # New payload for a task, sent from its next due time on
+        return self.modify(task_id, data=data)
+
+    def remove(self, task_id):
+        with self.cond:
+            task = self.tasks.pop(task_id, None)
+            if(task is None):
+                return False
+            # Its heap entry is discarded when it comes up; wake the thread if it was next
+            self.cond.notify()
+        return True
+
+    def remove_all(self):
+        with self.cond:
+            self.tasks.clear()
+            self.heap.clear()
+            self.cond.notify()
+
+    def get_task(self, task_id):
+        return self.tasks.get(task_id)
+
+    def summary(self):
+        # One line for the status bar
+        with self.cond:
+            tasks = list(self.tasks.values())
+        if(not tasks):
+            return ""
+        num_sent = sum(task.sent for task in tasks)
+        summary_str = "Cyclic TX %d tasks, %d sent in %d writes" % (len(tasks), num_sent, self.writes)
+        num_missed = sum(task.missed for task in tasks)
+        if(num_missed > 0):
+            summary_str += ", %d missed" % num_missed
+        summary_str += ", jitter max %s" % USBCanAnalyzerV7.format_us(max(task.max_jitter_us() for task in tasks))
+        return summary_str
+
+    #####################################################################
+    # Scheduler thread
+    #####################################################################
+
+    def schedule(self, task):
+        # Call with cond held. Supersedes any entry the task already has in the heap.
+        task.version += 1
+        heapq.heappush(self.heap, (task.next_due_ns, task.task_id, task.version))
+        self.cond.notify()
+
+    def wait_due(self):
+        # Call with cond held. Sleeps until at least one task is due, then pops it and every
+        # other task due within COALESCE_NS. Returns a list of (task, due time, version),
+        # or None once stopped.
+        heap = self.heap
+        while(self.running):
+            while(heap):
+                due_ns, task_id, version = heap[0]
+                task = self.tasks.get(task_id)
+                if(task is not None and task.version == version):
+                    break
+                heapq.heappop(heap)
+            if(not heap):
+                self.cond.wait()
+                continue
+            now = time.perf_counter_ns()
+            wait_ns = heap[0][0] - now
+            if(wait_ns > 0):
+                # Woken early by add/modify/remove, re-check the earliest due time
+                self.cond.wait(wait_ns / 1e9)
+                continue
+
+            due_list = []
+            while(heap and heap[0][0] <= now + self.COALESCE_NS):
+                due_ns, task_id, version = heapq.heappop(heap)
+                task = self.tasks.get(task_id)
+                if(task is not None and task.version == version):
+                    due_list.append((task, due_ns, version))
+            return due_list
+        return None
+
+    def run(self):
+        while(True):
+            with self.cond:
+                due_list = self.wait_due()
+                if(due_list is None):
+                    return
+                frames = [(task.can_id, task.data) for task, due_ns, version in due_list]
+
+            # The lock is not held while writing, so add/modify/remove never wait on the port.
+            # While the bus is offline tasks keep their schedule but nothing is sent.
+            sent_ns = time.perf_counter_ns()
+            is_sent = self.device.is_open()
+            if(is_sent):
+                try:
+                    self.device.send_many(frames)
+                except Exception:
+                    cyclic_log.exception("Cyclic send failed")
+                    is_sent = False
+
+            with self.cond:
+                if(is_sent):
+                    self.writes += 1
+                for task, due_ns, version in due_list:
+                    if(task.version != version or self.tasks.get(task.task_id) is not task):
+                        # Modified or removed while sending; modify() has already rescheduled it
+                        continue
+                    if(is_sent):
+                        task.note_sent(due_ns, sent_ns)
+                    next_due_ns = due_ns + task.period_ns
+                    if(next_due_ns <= sent_ns):
+                        # Whole periods went by without a send; skip them
+                        skipped = (sent_ns - next_due_ns) // task.period_ns + 1
+                        task.missed += skipped
+                        next_due_ns += skipped * task.period_ns
+                    task.next_due_ns = next_due_ns
+                    task.version += 1
+                    heapq.heappush(self.heap, (next_due_ns, task.task_id, task.version))
@@ -23,9 +23,21 @@
 #   -- This result is added with the value Offset
 #   -- This result is displayed in the GUI, after the string Name
 #
+# Data is treated as one little-endian integer: the first data byte is the lowest 8 bits.
+#
+# Stage 3: Compilation
+#  -- When the database is loaded, the interpreters are compiled into a flat decode plan
+#     of plain tuples (ints and floats only, source resolved to SOURCE_ID/SOURCE_DATA),
+#     so that decoding a message does no attribute lookups or string compares.
+#  -- Interpreters are tried in file order and the first match wins.
+#  -- To avoid trying every interpreter, they are also indexed by ID mask: for each distinct
+#     id_mask there is a dict from id_compare to the interpreters using it. Finding the
+#     candidates for an ID then costs one dict lookup per distinct mask, and the results
+#     (sorted back into file order) are kept in an LRU cache keyed on the raw CAN ID.
+#
 # Example XML:
 #  <CanDatabase>
-#    <Interpreter id_mask="0xFFFFFF00" id_compare="0x12345600" data_len=8>
+#    <Interpreter Name="MyMessage" id_mask="0xFFFFFF00" id_compare="0x12345600" data_len=8>
 #       <DataElem Name="Addr" Source="id" Mask="0x000000FF" Downshift=0 Scale=1 Offset=0/>
 #       <DataElem Name="Speed" Source="data" Mask="0x00000000000AFF00" Downshift=8 Scale=0.125 Offset=0/>
 #    </Interpreter>
@@ -38,13 +50,32 @@
 #
 ##################################################################################################
 import xml.etree.ElementTree as ET
+import functools
 
+# Where a data element takes its bits from
+SOURCE_ID = 0
+SOURCE_DATA = 1
 
 
 class dbProcessor():
 
     msgInterpreterList = []
 
+    # Compiled from msgInterpreterList by compile(). One entry per interpreter, in file order:
+    #   (id_mask, id_compare, data_len, name, elements)
+    # where elements is a tuple of (name, source, mask, downshift, scale, offset)
+    decodePlan = ()
+    maskBuckets = ()
+    # decode_batch() output keys, one tuple per plan entry with one key per element
+    signalKeys = ()
+    # Plan entry (by id()) -> its index in decodePlan
+    planIndex = {}
+    # Per-element numpy tables for decode_batch(), built on first use since numpy is optional
+    batchTables = None
+
+    # Number of distinct CAN IDs whose candidate interpreters are remembered
+    ID_CACHE_SIZE = 4096
+
     def loadDb(self, fpath):
         with open(fpath, 'r') as f:
             #Reset interpreter list
@@ -57,9 +88,10 @@ class dbProcessor():
             if(xml_root != None):
                 #For each message interpreter in the XML file, make a new interpreter
                 for child in xml_root.findall('Interpreter'):
-                    new_interpreter = msgInterpreter(child.get('id_mask'), 
-                                                    child.get('id_compare'), 
-                                                    int(child.get('data_len'),0))
+                    new_interpreter = msgInterpreter(int(child.get('id_mask'),0),
+                                                    int(child.get('id_compare'),0),
+                                                    int(child.get('data_len'),0),
+                                                    child.get('Name', child.get('id_compare')))
 
                     #For each data interpreter in the message interpreter, add it.
                     for dataint in child:
@@ -70,8 +102,164 @@ class dbProcessor():
                                                         float(dataint.get('Scale')),
                                                         float(dataint.get('Offset')))
                     self.msgInterpreterList.append(new_interpreter)
+        self.compile()
         return
 
+    def compile(self):
+        # Flatten the interpreter objects into the decode plan
+        plan = []
+        for msgInt in self.msgInterpreterList:
+            elements = tuple((dataint.name,
+                              dataint.source_id,
+                              dataint.mask,
+                              dataint.downshift,
+                              dataint.scale,
+                              dataint.offset) for dataint in msgInt.dataInterpreters)
+            plan.append((msgInt.id_mask, msgInt.id_compare, msgInt.exp_data_len, msgInt.name, elements))
+        self.decodePlan = tuple(plan)
+        self.planIndex = {id(entry): plan_idx for plan_idx, entry in enumerate(self.decodePlan)}
+        self.signalKeys = tuple(tuple((id_mask, id_compare, data_len, elem[0]) for elem in elements)
+                                for id_mask, id_compare, data_len, _, elements in self.decodePlan)
+        self.batchTables = None
+
+        # Mask buckets: {id_mask: {id_compare: [plan index, ...]}}
+        buckets = {}
+        for plan_idx, entry in enumerate(self.decodePlan):
+            id_mask, id_compare = entry[0], entry[1]
+            if(id_compare & ~id_mask):
+                # Compare value has bits outside the mask, this can never match
+                continue
+            buckets.setdefault(id_mask, {}).setdefault(id_compare, []).append(plan_idx)
+        self.maskBuckets = tuple(buckets.items())
+
+        self.lookupCandidates = functools.lru_cache(maxsize=self.ID_CACHE_SIZE)(self._findCandidates)
+
+    def _findCandidates(self, can_id):
+        # All plan entries whose id_mask/id_compare match can_id, in file order
+        matched = []
+        for id_mask, compares in self.maskBuckets:
+            plan_indices = compares.get(can_id & id_mask)
+            if(plan_indices is not None):
+                matched.extend(plan_indices)
+        matched.sort()
+        return tuple(self.decodePlan[plan_idx] for plan_idx in matched)
+
+    def lookupCandidates(self, can_id):
+        # Replaced by the cached version in compile()
+        return ()
+
+    def decode(self, can_id, payload, data_len):
+        # Fast path used by the GUI. can_id and payload are ints (payload little-endian,
+        # see CanPacket.payload). Returns (name, [(element name, value), ...]) for the
+        # first matching interpreter, or None if nothing matches.
+        for id_mask, id_compare, exp_data_len, name, elements in self.lookupCandidates(can_id):
+            if(data_len == exp_data_len):
+                values = []
+                for elem_name, source, mask, downshift, scale, offset in elements:
+                    if(source == SOURCE_ID):
+                        working_val = can_id
+                    else:
+                        working_val = payload
+                    values.append((elem_name, ((working_val & mask) >> downshift) * scale + offset))
+                return (name, values)
+        return None
+
+    def decode_batch(self, ids, payloads, data_lens=None, timestamps=None):
+        # Columnar decode of many messages at once, e.g. a whole recorded log. Requires numpy.
+        #  -- ids: array of CAN IDs
+        #  -- payloads: array of little-endian uint64 payloads, or an (N, 8) uint8 array of data bytes
+        #  -- data_lens: optional array of data lengths. If omitted, the data_len check is skipped.
+        #  -- timestamps: optional array of receive times, one per message
+        # A FrameStore view can be passed straight in:
+        #   decode_batch(frames['can_id'], frames['payload'], frames['dlc'], frames['timestamp_ns'])
+        #
+        # Returns (match, signals):
+        #  -- match: int array with the index into decodePlan used for each message, -1 if none matched
+        #  -- signals: {(id_mask, id_compare, data_len, element name): (times, values)}. values is
+        #     a float64 array with one entry per message decoded by that element's interpreter, and
+        #     times holds the matching entries of timestamps (or the row indices into the inputs if
+        #     no timestamps given). Messages sharing an ID compare value but not a data length get
+        #     separate keys; like getInfo(), an element name repeated in one interpreter keeps the last.
+        import numpy as np
+
+        if(self.batchTables is None):
+            self.batchTables = self._buildBatchTables(np)
+        elem_is_id, elem_mask, elem_shift, elem_scale, elem_offset = self.batchTables
+
+        ids = np.asarray(ids, dtype=np.uint64)
+        payloads = np.asarray(payloads)
+        if(payloads.ndim == 2):
+            payloads = np.ascontiguousarray(payloads, dtype=np.uint8).view('<u8').reshape(-1)
+        payloads = payloads.astype(np.uint64, copy=False)
+
+        # Matching only depends on (ID, data_len), and logs repeat the same few IDs over and over,
+        # so match each distinct key once with the indexed lookup and broadcast the result back.
+        if(data_lens is None):
+            keys = ids
+        else:
+            keys = (ids << np.uint64(4)) | (np.asarray(data_lens, dtype=np.uint64) & np.uint64(0x0F))
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        plan_index = self.planIndex
+        key_match = np.full(len(unique_keys), -1, dtype=np.int32)
+        for key_idx, key in enumerate(unique_keys.tolist()):
+            if(data_lens is None):
+                can_id, data_len = key, None
+            else:
+                can_id, data_len = key >> 4, key & 0x0F
+            for entry in self.lookupCandidates(can_id):
+                if(data_len is None or data_len == entry[2]):
+                    key_match[key_idx] = plan_index[id(entry)]
+                    break
+        match = key_match[inverse.reshape(-1)]
+
+        if(timestamps is not None):
+            timestamps = np.asarray(timestamps)
+
+        # Group the rows by interpreter with one stable sort, rather than one scan per interpreter,
+        # dropping the unmatched rows (sorted first)
+        order = np.argsort(match, kind='stable')
+        rows = order[np.searchsorted(match[order], 0, side='left'):]
+        row_match = match[rows]
+        used_plan_indices = np.unique(row_match)
+        group_starts = np.searchsorted(row_match, used_plan_indices, side='left')
+        group_ends = np.searchsorted(row_match, used_plan_indices, side='right')
+        if(timestamps is not None):
+            times = timestamps[rows]
+        else:
+            times = rows
+
+        # Every element of every matched row in one pass over (element slot, row) arrays, so the
+        # per-interpreter work below is only slicing
+        if(elem_mask.shape[1] > 0):
+            working_val = np.where(elem_is_id[row_match].T, ids[rows], payloads[rows])
+            working_val &= elem_mask[row_match].T
+            working_val >>= elem_shift[row_match].T
+            values = working_val.astype(np.float64)
+            values *= elem_scale[row_match].T
+            values += elem_offset[row_match].T
+
+        signals = {}
+        signal_keys = self.signalKeys
+        for plan_idx, group_start, group_end in zip(used_plan_indices.tolist(), group_starts.tolist(), group_ends.tolist()):
+            group_times = times[group_start:group_end]
+            for elem_idx, key in enumerate(signal_keys[plan_idx]):
+                signals[key] = (group_times, values[elem_idx, group_start:group_end])
+
+        return match, signals
+
+    def _buildBatchTables(self, np):
+        # (is id, mask, downshift, scale, offset) arrays of shape (plan entries, most elements in
+        # one entry); slots past an entry's own elements are zero and never read
+        num_slots = max((len(entry[4]) for entry in self.decodePlan), default=0)
+        padding = ((None, SOURCE_DATA, 0, 0, 0.0, 0.0),) * num_slots
+        rows = [(entry[4] + padding)[:num_slots] for entry in self.decodePlan]
+        tables = []
+        for field, dtype in ((1, np.int8), (2, np.uint64), (3, np.uint64), (4, np.float64), (5, np.float64)):
+            tables.append(np.array([[elem[field] for elem in row] for row in rows], dtype=dtype).reshape(len(rows), num_slots))
+        tables[0] = (tables[0] == SOURCE_ID)
+        return tuple(tables)
+
     def getInfo(self, can_id, can_data):
         #Uses the loaded database to interpret a CAN Message (ID + Data) 
         # into a python dictonary with the format:
@@ -86,34 +274,36 @@ class dbProcessor():
         #            
         # }
         # 
+        # can_id may be an int or the raw ID bytes (LSB first), can_data is the data bytes.
         # If no matching interpretation of the message is found, returns None
         #
-        retval = None
+        if(not isinstance(can_id, int)):
+            can_id = int.from_bytes(can_id, byteorder='little')
 
-        for msgInt in self.msgInterpreterList:
-            if(msgInt.checkID(can_id, can_data)):
-                retval = {'name':msgInt.name,'data':{}}
-                for dataint in msgInt.dataInterpreters:
-                    retval['data'].append(dataint.intepret(can_id, can_data))
+        decoded = self.decode(can_id, int.from_bytes(can_data, byteorder='little'), len(can_data))
+        if(decoded is None):
+            return None
 
-        return retval
+        name, values = decoded
+        return {'name':name, 'data':{elem_name: str(value) for elem_name, value in values}}
 
 
 class msgInterpreter():
-    def __init__(self, id_mask, id_compare, exp_data_len):
+    def __init__(self, id_mask, id_compare, exp_data_len, name=""):
         self.id_mask = id_mask
         self.id_compare = id_compare
         self.exp_data_len = exp_data_len
+        self.name = name
         self.dataInterpreters = []
 
     def addDataInterpreter(self, name, source, mask, downshift, scale, offset):
         newInterpreter = dataInterpreter(name, source, mask, downshift, scale, offset)
         self.dataInterpreters.append(newInterpreter)
 
-    def checkID(self, can_id):
+    def checkID(self, can_id, data_len=None):
         working_val = can_id
         working_val &= self.id_mask
-        if(working_val == self.id_compare):
+        if(working_val == self.id_compare and (data_len is None or data_len == self.exp_data_len)):
             return True
         else:
             return False
@@ -124,13 +314,17 @@ class dataInterpreter():
     def __init__(self, name, source, mask, downshift, scale, offset):
         self.name = name
         self.source = source
+        if("id" in source.lower()):
+            self.source_id = SOURCE_ID
+        else:
+            self.source_id = SOURCE_DATA
         self.mask = mask
         self.downshift = downshift
         self.scale = scale
         self.offset = offset
 
     def interpret(self, can_id, can_data):
-        if(self.source.contain("id")):
+        if(self.source_id == SOURCE_ID):
             working_val = can_id
         else:
             working_val = can_data
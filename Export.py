@@ -0,0 +1,189 @@
+##################################################################################################
+# Streaming export of captured messages to text log formats.
+#
+# Supported formats:
+#  -- csv:     time,channel,id,extended,data,name,signals - the viewer's own report, with decoded values
+#  -- asc:     Vector ASCII log, readable by CANalyzer/CANoe and most CAN tools (channel N+1)
+#  -- candump: Linux can-utils "candump -l" log, which canplayer can replay (interface canN)
+#
+# Messages are taken from any iterable of records
+#   (timestamp_ns, can_id, dlc, flags, channel, payload)
+# such as CaptureFile.CaptureReader.iter_records(), or packets_to_records() over CanPackets.
+# Lines are formatted and written CHUNK_LINES at a time, so memory use stays flat no matter
+# how long the capture is. ExportJob runs an export on a background thread, with progress
+# and cancel.
+##################################################################################################
+import threading
+import datetime
+import os
+import io
+import csv
+
+import USBCanAnalyzerV7
+
+FORMATS = ('csv', 'asc', 'candump')
+FILE_EXTENSIONS = {'csv':'.csv', 'asc':'.asc', 'candump':'.log'}
+
+
+def packets_to_records(packet_list):
+    for packet in packet_list:
+        yield (packet.rx_time_ns, packet.can_id, packet.dlc, packet.flags, packet.channel, packet.payload)
+
+
+def data_bytes(payload, dlc):
+    return payload.to_bytes(8, byteorder='little')[:dlc]
+
+
+class CsvFormat():
+
+    def __init__(self, start_time_ns, wall_offset_ns, msg_db=None):
+        self.start_time_ns = start_time_ns
+        self.msg_db = msg_db
+        # Names and signal values come from the database and may contain commas or quotes,
+        # so rows go through csv.writer, one at a time into a reused string buffer
+        self.row_buffer = io.StringIO()
+        self.row_writer = csv.writer(self.row_buffer, lineterminator="\r\n")
+
+    def format_row(self, row):
+        self.row_writer.writerow(row)
+        row_str = self.row_buffer.getvalue()
+        self.row_buffer.seek(0)
+        self.row_buffer.truncate()
+        return row_str
+
+    def header(self):
+        return self.format_row(("time", "channel", "id", "extended", "data", "name", "signals"))
+
+    def line(self, timestamp_ns, can_id, dlc, flags, channel, payload):
+        name_str = ""
+        signals_str = ""
+        if(self.msg_db is not None):
+            msg_interpretation = self.msg_db.decode(can_id, payload, dlc)
+            if(msg_interpretation != None):
+                name_str = msg_interpretation[0]
+                signals_str = ";".join(elem_name + "=" + str(value) for elem_name, value in msg_interpretation[1])
+        data_str = data_bytes(payload, dlc).hex(" ").upper()
+        extended = 1 if flags & USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED else 0
+        return self.format_row(("%.6f" % ((timestamp_ns - self.start_time_ns) / 1e9), channel, format(can_id, '#X'),
+                                extended, data_str, name_str, signals_str))
+
+    def footer(self):
+        return ""
+
+
+class AscFormat():
+
+    def __init__(self, start_time_ns, wall_offset_ns, msg_db=None):
+        self.start_time_ns = start_time_ns
+        self.start_wall = datetime.datetime.fromtimestamp((start_time_ns + wall_offset_ns) / 1e9)
+
+    def header(self):
+        date_str = self.start_wall.strftime("%a %b %d %I:%M:%S.") + format(self.start_wall.microsecond // 1000, '03d') + self.start_wall.strftime(" %p %Y").lower()
+        return ("date " + date_str + "\n"
+                "base hex  timestamps absolute\n"
+                "internal events logged\n"
+                "Begin Triggerblock " + date_str + "\n")
+
+    def line(self, timestamp_ns, can_id, dlc, flags, channel, payload):
+        if(flags & USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED):
+            id_str = format(can_id, 'X') + "x"
+        else:
+            id_str = format(can_id, 'X')
+        data_str = data_bytes(payload, dlc).hex(" ").upper()
+        # ASC channels count from 1
+        return "%11.6f %d  %-15s Rx   d %d %s\n" % ((timestamp_ns - self.start_time_ns) / 1e9, channel + 1, id_str, dlc, data_str)
+
+    def footer(self):
+        return "End TriggerBlock\n"
+
+
+class CandumpFormat():
+
+    INTERFACE_NAME = "can%d"
+
+    def __init__(self, start_time_ns, wall_offset_ns, msg_db=None):
+        self.wall_offset_ns = wall_offset_ns
+
+    def header(self):
+        return ""
+
+    def line(self, timestamp_ns, can_id, dlc, flags, channel, payload):
+        wall_ns = timestamp_ns + self.wall_offset_ns
+        if(flags & USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED):
+            id_str = format(can_id, '08X')
+        else:
+            id_str = format(can_id, '03X')
+        return "(%d.%06d) %s %s#%s\n" % (wall_ns // 1000000000, (wall_ns // 1000) % 1000000, self.INTERFACE_NAME % channel,
+                                         id_str, data_bytes(payload, dlc).hex().upper())
+
+    def footer(self):
+        return ""
+
+
+FORMAT_CLASSES = {'csv':CsvFormat, 'asc':AscFormat, 'candump':CandumpFormat}
+
+
+class ExportJob(threading.Thread):
+    # Writes records to fpath in the given format on a background thread.
+    #  -- total_records, if known, is used for progress()
+    #  -- start_time_ns is the capture start (times in csv/asc are relative to it)
+    #  -- wall_offset_ns converts record timestamps to ns since the epoch, for candump/asc
+    # A cancelled export removes its partially written file.
+
+    CHUNK_LINES = 4096
+
+    def __init__(self, records, fpath, fmt, start_time_ns, wall_offset_ns, total_records=None, msg_db=None):
+        super().__init__()
+        self.daemon = True
+        self.records = records
+        self.fpath = fpath
+        self.formatter = FORMAT_CLASSES[fmt](start_time_ns, wall_offset_ns, msg_db)
+        self.total_records = total_records
+        self.records_done = 0
+        self.error = None
+        self.cancelled = False
+        self.cancel_event = threading.Event()
+
+    def run(self):
+        try:
+            with open(self.fpath, 'w', newline='') as f:
+                f.write(self.formatter.header())
+                line = self.formatter.line
+                chunk = []
+                for record in self.records:
+                    chunk.append(line(*record))
+                    if(len(chunk) == self.CHUNK_LINES):
+                        f.write("".join(chunk))
+                        chunk = []
+                        self.records_done += self.CHUNK_LINES
+                        if(self.cancel_event.is_set()):
+                            break
+                if(not self.cancel_event.is_set()):
+                    f.write("".join(chunk))
+                    self.records_done += len(chunk)
+                    f.write(self.formatter.footer())
+            if(self.cancel_event.is_set()):
+                self.cancelled = True
+                os.remove(self.fpath)
+        except Exception as e:
+            # Anything, e.g. a bad database entry failing to decode: the GUI must not report
+            # a truncated file as a finished export
+            self.error = e
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def progress(self):
+        # Fraction complete, or None if the total is unknown
+        if(not self.total_records):
+            return None
+        return min(1.0, self.records_done / self.total_records)
+
+
+def export_file(records, fpath, fmt, start_time_ns, wall_offset_ns, msg_db=None):
+    # Blocking export on the calling thread
+    job = ExportJob(records, fpath, fmt, start_time_ns, wall_offset_ns, msg_db=msg_db)
+    job.run()
+    if(job.error is not None):
+        raise job.error
+    return job.records_done
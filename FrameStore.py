@@ -0,0 +1,187 @@
+##################################################################################################
+# Columnar storage for long captures.
+#
+# Keeping one python object per received frame costs a couple hundred bytes per frame, which
+# adds up fast on a busy bus. The FrameStore instead packs every frame into one row of a
+# preallocated NumPy structured array:
+#
+#   timestamp_ns  int64    monotonic receive time (CanPacket.rx_time_ns)
+#   can_id        uint32
+#   dlc           uint8
+#   flags         uint8    CanPacket.FLAG_* bits
+#   channel       uint8    CanPacket.channel, the adapter/bus it was received on
+#   data          uint8[8] payload bytes, zero padded past dlc
+#   payload       uint64   the same 8 bytes read as one little-endian int (overlaps data)
+#
+# That is 24 bytes per frame. The array grows CHUNK_FRAMES rows at a time. If max_frames is
+# given it stops growing there and becomes a ring buffer, overwriting the oldest frames.
+#
+# Reads hand out NumPy views rather than copies wherever the layout allows it:
+#  -- segments() gives the stored frames, oldest first, as one or two contiguous views
+#     (two once the ring has wrapped)
+#  -- time_range() binary searches the timestamps and returns a view, unless the range
+#     happens to straddle the ring's wrap point, in which case the two halves are joined
+#  -- select_id() needs a boolean mask, so it returns a compact copy of only the matches
+#
+# Requires numpy.
+##################################################################################################
+import numpy as np
+
+
+FRAME_DTYPE = np.dtype({'names':   ['timestamp_ns', 'can_id', 'dlc', 'flags', 'channel', 'data', 'payload'],
+                        'formats': ['<i8', '<u4', 'u1', 'u1', 'u1', ('u1', (8,)), '<u8'],
+                        'offsets': [0, 8, 12, 13, 14, 16, 16],
+                        'itemsize': 24})
+
+
+class FrameStore():
+
+    CHUNK_FRAMES = 65536
+
+    def __init__(self, max_frames=None, chunk_frames=None):
+        if(chunk_frames is not None):
+            self.CHUNK_FRAMES = chunk_frames
+        self.max_frames = max_frames
+        self.clear()
+
+    def clear(self):
+        initial = self.CHUNK_FRAMES
+        if(self.max_frames is not None):
+            initial = min(initial, self.max_frames)
+        self.frames = np.zeros(initial, dtype=FRAME_DTYPE)
+        # Index of the oldest frame, and number of valid frames
+        self.head = 0
+        self.count = 0
+        # Total frames ever appended, including any overwritten by the ring
+        self.total_appended = 0
+
+    def __len__(self):
+        return self.count
+
+    def capacity(self):
+        return len(self.frames)
+
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def append(self, timestamp_ns, can_id, dlc, payload, flags=0, channel=0):
+        row = self._reserve(1)[0].start
+        self.frames[row] = (timestamp_ns, can_id, dlc, flags, channel, (0,) * 8, payload)
+
+    def append_packet(self, packet):
+        self.append(packet.rx_time_ns, packet.can_id, packet.dlc, packet.payload, packet.flags, packet.channel)
+
+    def extend_packets(self, packets):
+        # Bulk insert of a list of CanPackets. Each column is built with one fromiter() call
+        # and copied in with slice assignment.
+        num = len(packets)
+        if(num == 0):
+            return
+        if(self.max_frames is not None and num > self.max_frames):
+            # Only the newest max_frames could survive anyway
+            packets = packets[num - self.max_frames:]
+            self.total_appended += num - self.max_frames
+            num = self.max_frames
+
+        timestamps = np.fromiter((p.rx_time_ns for p in packets), dtype=np.int64, count=num)
+        can_ids = np.fromiter((p.can_id for p in packets), dtype=np.uint32, count=num)
+        dlcs = np.fromiter((p.dlc for p in packets), dtype=np.uint8, count=num)
+        flags = np.fromiter((p.flags for p in packets), dtype=np.uint8, count=num)
+        channels = np.fromiter((p.channel for p in packets), dtype=np.uint8, count=num)
+        payloads = np.fromiter((p.payload for p in packets), dtype=np.uint64, count=num)
+
+        pos = 0
+        for row_slice in self._reserve(num):
+            end = pos + (row_slice.stop - row_slice.start)
+            dest = self.frames[row_slice]
+            dest['timestamp_ns'] = timestamps[pos:end]
+            dest['can_id'] = can_ids[pos:end]
+            dest['dlc'] = dlcs[pos:end]
+            dest['flags'] = flags[pos:end]
+            dest['channel'] = channels[pos:end]
+            dest['payload'] = payloads[pos:end]
+            pos = end
+
+    def segments(self):
+        # Stored frames, oldest first, as a list of at most two contiguous views
+        cap = len(self.frames)
+        end = self.head + self.count
+        if(end <= cap):
+            return [self.frames[self.head:end]]
+        else:
+            return [self.frames[self.head:cap], self.frames[0:end - cap]]
+
+    def view(self):
+        # All stored frames, oldest first. A view unless the ring has wrapped.
+        return self._join(self.segments())
+
+    def time_range(self, start_ns, end_ns):
+        # Frames with start_ns <= timestamp_ns < end_ns
+        matches = []
+        for segment in self.segments():
+            stamps = segment['timestamp_ns']
+            lo = np.searchsorted(stamps, start_ns, side='left')
+            hi = np.searchsorted(stamps, end_ns, side='left')
+            if(hi > lo):
+                matches.append(segment[lo:hi])
+        return self._join(matches)
+
+    def select_id(self, can_id, id_mask=None):
+        # Frames whose ID matches exactly, or (ID & id_mask) == can_id if a mask is given
+        matches = []
+        for segment in self.segments():
+            ids = segment['can_id']
+            if(id_mask is not None):
+                ids = ids & id_mask
+            matches.append(segment[ids == can_id])
+        return np.concatenate(matches)
+
+    #####################################################################
+    #PRIVATE Methods
+    #####################################################################
+
+    def _join(self, views):
+        if(len(views) == 0):
+            return self.frames[0:0]
+        elif(len(views) == 1):
+            return views[0]
+        else:
+            return np.concatenate(views)
+
+    def _grow(self, min_capacity):
+        new_capacity = len(self.frames)
+        while(new_capacity < min_capacity):
+            new_capacity += self.CHUNK_FRAMES
+        if(self.max_frames is not None):
+            new_capacity = min(new_capacity, self.max_frames)
+        if(new_capacity == len(self.frames)):
+            return
+
+        new_frames = np.zeros(new_capacity, dtype=FRAME_DTYPE)
+        pos = 0
+        for segment in self.segments():
+            new_frames[pos:pos + len(segment)] = segment
+            pos += len(segment)
+        self.frames = new_frames
+        self.head = 0
+
+    def _reserve(self, num):
+        # Make room for num new frames at the end, overwriting the oldest if the ring is full.
+        # Returns the row slices to write, in order (two if the write wraps around).
+        if(self.count + num > len(self.frames)):
+            self._grow(self.count + num)
+
+        cap = len(self.frames)
+        overflow = self.count + num - cap
+        if(overflow > 0):
+            # Ring is full, drop the oldest frames
+            self.head = (self.head + overflow) % cap
+            self.count -= overflow
+
+        start = (self.head + self.count) % cap
+        self.count += num
+        self.total_appended += num
+        if(start + num <= cap):
+            return [slice(start, start + num)]
+        else:
+            return [slice(start, cap), slice(0, start + num - cap)]
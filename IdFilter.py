@@ -0,0 +1,96 @@
+##################################################################################################
+# Software CAN ID filter, applied to received messages before any decoding or display.
+#
+# A filter is written as two comma separated rule lists, include and exclude. Each rule is:
+#  -- an ID:                  18F00400
+#  -- an inclusive ID range:  100-1FF
+#  -- a compare/mask pair:    18F00400/1FFFFF00  (matches if id & mask == compare & mask,
+#                             the same test as the database's id_compare/id_mask)
+# All numbers are hex. A message passes if it matches an include rule (or there are no
+# include rules) and matches no exclude rule. Empty lists let everything through.
+#
+# Rules are compiled once: single IDs go in a set, mask rules are bucketed by mask so each
+# mask costs one AND and one set lookup, and ranges are kept as sorted (low, high) pairs. The
+# verdict for each ID is then cached, so steady traffic costs one cache lookup per message.
+##################################################################################################
+import functools
+import bisect
+
+
+class IdRuleSet():
+
+    def __init__(self, rules_str=""):
+        self.rules_str = rules_str
+        ids = set()
+        buckets = {}
+        ranges = []
+        for rule in rules_str.split(','):
+            rule = rule.strip()
+            if(rule == ""):
+                continue
+            if('/' in rule):
+                compare_str, mask_str = rule.split('/', 1)
+                id_mask = int(mask_str, 16)
+                buckets.setdefault(id_mask, set()).add(int(compare_str, 16) & id_mask)
+            elif('-' in rule):
+                low_str, high_str = rule.split('-', 1)
+                low, high = int(low_str, 16), int(high_str, 16)
+                if(low > high):
+                    raise ValueError("ID range " + rule + " is backwards")
+                ranges.append((low, high))
+            else:
+                ids.add(int(rule, 16))
+
+        self.ids = frozenset(ids)
+        self.maskBuckets = tuple((id_mask, frozenset(compares)) for id_mask, compares in buckets.items())
+
+        # Merge overlapping ranges so one bisect finds the only candidate
+        ranges.sort()
+        merged = []
+        for low, high in ranges:
+            if(merged and low <= merged[-1][1] + 1):
+                merged[-1] = (merged[-1][0], max(merged[-1][1], high))
+            else:
+                merged.append((low, high))
+        self.rangeLows = [low for low, high in merged]
+        self.rangeHighs = [high for low, high in merged]
+
+    def __len__(self):
+        return len(self.ids) + sum(len(compares) for id_mask, compares in self.maskBuckets) + len(self.rangeLows)
+
+    def matches(self, can_id):
+        if(can_id in self.ids):
+            return True
+        for id_mask, compares in self.maskBuckets:
+            if((can_id & id_mask) in compares):
+                return True
+        range_idx = bisect.bisect_right(self.rangeLows, can_id) - 1
+        return range_idx >= 0 and can_id <= self.rangeHighs[range_idx]
+
+
+class IdFilter():
+
+    # Number of distinct CAN IDs whose verdict is remembered
+    ID_CACHE_SIZE = 4096
+
+    def __init__(self, include_str="", exclude_str=""):
+        # Raises ValueError if either rule list cannot be parsed
+        self.include = IdRuleSet(include_str)
+        self.exclude = IdRuleSet(exclude_str)
+        self.empty = len(self.include) == 0 and len(self.exclude) == 0
+        self.dropped = 0
+        self.accepts = functools.lru_cache(maxsize=self.ID_CACHE_SIZE)(self._accepts)
+
+    def filter(self, packet_list):
+        # Messages from packet_list that pass, in order. Dropped ones are counted in dropped.
+        if(self.empty):
+            return packet_list
+        accepts = self.accepts
+        passed = [packet for packet in packet_list if accepts(packet.can_id)]
+        self.dropped += len(packet_list) - len(passed)
+        return passed
+
+    def _accepts(self, can_id):
+        if(len(self.include) > 0 and not self.include.matches(can_id)):
+            return False
+        return not self.exclude.matches(can_id)
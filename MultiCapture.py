@@ -0,0 +1,161 @@
+##################################################################################################
+# Capture from several USB-CAN Analyzer V7 adapters at once, as one time-ordered stream.
+#
+# Each adapter is a USBCanAnalyzerV7.DeviceInterface with its own framer, and tags its
+# packets with its channel number (its position in the port list). Rather than polling every
+# port, all their file descriptors are registered with one selectors loop (epoll on Linux),
+# so each receive() is a single select() call that names the ports with data waiting, and
+# only those are read.
+#
+# Adapters are read at slightly different moments, so a frame read from one port can be
+# older than one already read from another. Frames are therefore held per channel until
+# every channel has been read (or seen idle) past their timestamp, and then released in a
+# k-way heap merge on rx_time_ns. This holds frames back by about one receive() interval.
+#
+# Ports without a file descriptor (Windows COM ports, pySerial URLs such as loop://) cannot
+# be registered; they are polled on every receive() instead.
+##################################################################################################
+import selectors
+import heapq
+import operator
+import collections
+import time
+import logging
+
+import USBCanAnalyzerV7
+import CanBus
+
+multi_log = logging.getLogger(__name__)
+
+
+class MultiRxStats:
+    # Status bar summary across all channels, from each adapter's RxStats
+
+    def __init__(self, multi_device):
+        self.multi_device = multi_device
+
+    def summary(self):
+        devices = self.multi_device.devices
+        summary_str = "RX " + ", ".join("ch%d %d" % (dev.channel, dev.rx_stats.frames_parsed) for dev in devices) + " frames"
+        num_errors = sum(dev.rx_stats.total_errors() for dev in devices)
+        if(num_errors > 0):
+            summary_str += ", %d framing errors" % num_errors
+        summary_str += ", backlog max %d B" % max(dev.rx_stats.backlog_high_water for dev in devices)
+        summary_str += ", %d held for ordering" % self.multi_device.num_held()
+        return summary_str
+
+
+class MultiDeviceInterface(CanBus.CanBusInterface):
+
+    def __init__(self, comports, speed_kbps=1024, use_extended_frame=True, serial_baud=115200):
+        CanBus.CanBusInterface.__init__(self)
+        self.devices = [USBCanAnalyzerV7.DeviceInterface(speed_kbps, use_extended_frame, comport,
+                                                         serial_baud=serial_baud, channel=channel)
+                        for channel, comport in enumerate(comports)]
+        # Packets read but not yet released, per channel, oldest first
+        self.held = [collections.deque() for _ in self.devices]
+        self.selector = None
+        self.polled_devices = []
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+        self.rx_stats = MultiRxStats(self)
+
+    def open(self):
+        if(self.selector is not None):
+            multi_log.warning("Ports already open!")
+            return
+        for dev in self.devices:
+            dev.open()
+
+        self.selector = selectors.DefaultSelector()
+        self.polled_devices = []
+        for dev in self.devices:
+            try:
+                self.selector.register(dev.sp.fileno(), selectors.EVENT_READ, dev)
+            except (AttributeError, ValueError, OSError):
+                self.polled_devices.append(dev)
+        if(self.polled_devices):
+            multi_log.info("Polling %s, they cannot be waited on with select()",
+                           ", ".join(str(dev.sp.port) for dev in self.polled_devices))
+
+        # One time base for every channel, so their timestamps can be compared
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+        for dev in self.devices:
+            dev.capture_start_time = self.capture_start_time
+            dev.prev_capture_time = self.capture_start_time
+            dev.rx_prev_chunk_time = self.capture_start_time
+        self.capture_time_reset()
+        for held in self.held:
+            held.clear()
+
+    def close(self):
+        if(self.selector is not None):
+            self.selector.close()
+            self.selector = None
+        for dev in self.devices:
+            dev.close()
+
+    def is_open(self):
+        return self.selector is not None
+
+    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud, filters=None):
+        # Each channel keeps its own port, comport is ignored
+        for dev in self.devices:
+            dev.set_config(speed_kbps, use_extended_frame, dev.sp.port, serial_baud, filters)
+        if(filters is not None):
+            CanBus.CanBusInterface.set_filters(self, filters)
+
+    def set_filters(self, filters):
+        # Loaded into every adapter
+        CanBus.CanBusInterface.set_filters(self, filters)
+        for dev in self.devices:
+            dev.set_filters(filters)
+
+    def send(self, id, data, channel=0):
+        self.devices[channel].send(id, data)
+
+    def send_many(self, frames, channel=0):
+        return self.devices[channel].send_many(frames)
+
+    def receive(self):
+        if(self.selector is None):
+            return []
+
+        # Any port select() does not report has nothing waiting at this point, so whatever it
+        # receives next arrived after check_time_ns
+        check_time_ns = time.perf_counter_ns()
+        ready = [key.data for key, events in self.selector.select(0)]
+        for dev in ready + self.polled_devices:
+            packet_list = dev.receive()
+            if(packet_list):
+                self.held[dev.channel].extend(packet_list)
+
+        # Every channel is now known up to its last read. Only frames older than the least
+        # advanced channel are certain to have nothing older still to come.
+        for dev in self.devices:
+            if(dev.rx_prev_chunk_time < check_time_ns):
+                # Not read: nothing was waiting, so no frame from it can predate the check
+                dev.rx_prev_chunk_time = check_time_ns
+        horizon_ns = min(dev.rx_prev_chunk_time for dev in self.devices)
+
+        released = []
+        for held in self.held:
+            ready_list = []
+            while(held and held[0].rx_time_ns <= horizon_ns):
+                ready_list.append(held.popleft())
+            if(ready_list):
+                released.append(ready_list)
+
+        if(len(released) == 1):
+            packet_list = released[0]
+        else:
+            packet_list = list(heapq.merge(*released, key=operator.attrgetter('rx_time_ns')))
+        if(packet_list):
+            self.prev_capture_time = packet_list[-1].rx_time_ns
+
+        self.log_received(packet_list)
+        return packet_list
+
+    def num_held(self):
+        return sum(len(held) for held in self.held)
@@ -0,0 +1,162 @@
+##################################################################################################
+# Replay of recorded CAN logs.
+#
+# ReplayInterface implements the CanBus.CanBusInterface backend API, so a recorded log can
+# be fed through the GUI or the database decoder exactly like live traffic. Supported logs:
+#  -- .cvlog   the viewer's native capture log (CaptureFile)
+#  -- .log     Linux can-utils candump -l logs
+#  -- .csv     the viewer's own CSV export
+#
+# Timing:
+#  -- speed=1.0 releases each message at its original time offset from the first one
+#  -- speed=N releases them N times faster (or slower for N < 1)
+#  -- speed=None releases everything as fast as receive() is called, MAX_PACKETS_PER_RECEIVE
+#     at a time
+# Replayed packets keep their original relative timestamps, whatever the replay speed.
+# Logs are read lazily, so memory use does not depend on the log size.
+##################################################################################################
+import time
+import csv
+import os
+import logging
+
+import USBCanAnalyzerV7
+import CaptureFile
+import CanBus
+
+replay_log = logging.getLogger(__name__)
+
+
+def read_candump(fpath):
+    # Records from a candump -l log: "(1600000000.123456) can0 18F00400#0011223344556677"
+    # The channel is the interface's number (can2 -> 2), as the candump export writes it.
+    # Interfaces without one get the next free number, in order of first appearance.
+    channels = {}
+    with open(fpath, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if(len(fields) < 3 or not fields[0].startswith('(')):
+                continue
+            id_str, sep, data_str = fields[2].partition('#')
+            if(sep == "" or data_str.startswith('#') or data_str.startswith('R')):
+                # Not a classic CAN data frame (CAN FD or remote frame)
+                continue
+            sec_str, _, usec_str = fields[0].strip('()').partition('.')
+            timestamp_ns = int(sec_str) * 1000000000 + int(usec_str.ljust(9, '0')[:9])
+            data = bytes.fromhex(data_str)
+            flags = USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED if len(id_str) > 3 else 0
+            channel = channels.get(fields[1])
+            if(channel is None):
+                iface_num = fields[1][len(fields[1].rstrip('0123456789')):]
+                channel = int(iface_num) if iface_num else len(channels)
+                channels[fields[1]] = channel
+            yield (timestamp_ns, int(id_str, 16), len(data), flags, channel, int.from_bytes(data, byteorder='little'))
+
+
+def read_csv(fpath):
+    # Records from the viewer's CSV export: "time,channel,id,extended,data,..." with time in seconds.
+    # Columns are found from the header, so exports from before the channel or extended columns
+    # still load; without the extended column, IDs over 0x7FF are taken to be extended.
+    with open(fpath, 'r', newline='') as f:
+        rows = csv.reader(f)
+        columns = next(rows, [])
+        id_col = columns.index('id')
+        data_col = columns.index('data')
+        channel_col = columns.index('channel') if 'channel' in columns else None
+        extended_col = columns.index('extended') if 'extended' in columns else None
+        for fields in rows:
+            if(len(fields) <= data_col or fields[0] == ""):
+                continue
+            can_id = int(fields[id_col], 16)
+            data = bytes.fromhex(fields[data_col])
+            if(extended_col is not None):
+                is_extended = fields[extended_col] == "1"
+            else:
+                is_extended = can_id > 0x7FF
+            flags = USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED if is_extended else 0
+            channel = int(fields[channel_col]) if channel_col is not None else 0
+            yield (round(float(fields[0]) * 1e9), can_id, len(data), flags, channel, int.from_bytes(data, byteorder='little'))
+
+
+class ReplayInterface(CanBus.CanBusInterface):
+
+    MAX_PACKETS_PER_RECEIVE = 10000
+
+    def __init__(self, fpath, speed=1.0):
+        CanBus.CanBusInterface.__init__(self)
+        self.fpath = fpath
+        self.speed = speed
+        self.records = None
+        self.reader = None
+        self.next_record = None
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+
+    def open(self):
+        if(self.records is not None):
+            replay_log.warning("Replay already running!")
+            return
+
+        ext = os.path.splitext(self.fpath)[1].lower()
+        if(ext == '.cvlog'):
+            self.reader = CaptureFile.CaptureReader(self.fpath)
+            self.records = self.reader.iter_records()
+        elif(ext == '.csv'):
+            self.records = read_csv(self.fpath)
+        else:
+            self.records = read_candump(self.fpath)
+
+        self.next_record = next(self.records, None)
+        if(self.next_record is not None):
+            self.first_log_time_ns = self.next_record[0]
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+        self.capture_time_reset()
+        replay_log.info("Replaying %s", self.fpath)
+
+    def close(self):
+        if(self.reader is not None):
+            self.reader.close()
+            self.reader = None
+        self.records = None
+        self.next_record = None
+
+    def is_open(self):
+        return self.records is not None
+
+    def is_finished(self):
+        return self.next_record is None
+
+    def send(self, id, data):
+        replay_log.warning("Cannot transmit while replaying a log")
+
+    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud, filters=None):
+        if(filters is not None):
+            self.set_filters(filters)
+
+    def receive(self):
+        packet_list = []
+        if(self.next_record is None):
+            return packet_list
+
+        if(self.speed is None):
+            due_log_time_ns = None
+        else:
+            elapsed_ns = time.perf_counter_ns() - self.capture_start_time
+            due_log_time_ns = self.first_log_time_ns + elapsed_ns * self.speed
+
+        record = self.next_record
+        while(record is not None and len(packet_list) < self.MAX_PACKETS_PER_RECEIVE):
+            timestamp_ns, can_id, dlc, flags, channel, payload = record
+            if(due_log_time_ns is not None and timestamp_ns > due_log_time_ns):
+                break
+            rx_time_ns = self.capture_start_time + (timestamp_ns - self.first_log_time_ns)
+            packet_list.append(USBCanAnalyzerV7.CanPacket(self.capture_start_time, self.prev_capture_time,
+                                                          can_id, dlc, payload, flags, rx_time_ns, channel))
+            self.prev_capture_time = rx_time_ns
+            record = next(self.records, None)
+        self.next_record = record
+
+        packet_list = self.filter_packets(packet_list)
+        self.log_received(packet_list)
+        return packet_list
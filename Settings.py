@@ -1,11 +1,17 @@
 from tkinter import *
 import tkinter.simpledialog
+import tkinter.messagebox
 import configparser
+import logging
 import os, sys
 
 #Required to get the ports available
 import serial.tools.list_ports
 
+import IdFilter
+
+settings_log = logging.getLogger(__name__)
+
 
 class Settings():
 
@@ -15,6 +21,12 @@ class Settings():
     def __init__(self):
         self.load()
 
+    def openFilterGUI(self, master):
+        self.load()
+        filterGUI = idFilterDialogBox(parent=master, settings=self)
+        self.save()
+        filterGUI.destroy()
+
     def openGUI(self, master):
         self.load()
         settingsGUI = settingsDialogBox(parent=master, settings=self)
@@ -26,7 +38,7 @@ class Settings():
         def getValWithDefault(cfg_in, section_str, val_str, default):
             try:
                 section = cfg_in[section_str]
-                return section.get(val_str)
+                return section.get(val_str, default)
             except:
                 print(sys.exc_info())
                 return default
@@ -39,6 +51,7 @@ class Settings():
             config.read(self.SETTINGS_FNAME)
         else:
             config['V7CAN_DEVICE'] = {}
+            config['ID_FILTER'] = {}
             with open(self.SETTINGS_FNAME, 'w') as cfgfile:
                 config.write(cfgfile)
 
@@ -48,6 +61,31 @@ class Settings():
         self.can_use_extended_frame = getValWithDefault(config,'V7CAN_DEVICE','can_use_extended_frame', True)
         self.can_serial_baud = getValWithDefault(config,'V7CAN_DEVICE', 'can_serial_baud', 115200)
         self.can_serial_comport = getValWithDefault(config,'V7CAN_DEVICE', 'can_serial_comport', "COM5")
+        #Acceptance filter loaded into the adapter, hex strings. A mask of 0 accepts every ID.
+        self.can_filter_id = getValWithDefault(config,'V7CAN_DEVICE', 'can_filter_id', "0")
+        self.can_filter_mask = getValWithDefault(config,'V7CAN_DEVICE', 'can_filter_mask', "0")
+
+        #Software ID filter rule lists, see IdFilter.py
+        self.id_filter_include = getValWithDefault(config, 'ID_FILTER', 'include', "")
+        self.id_filter_exclude = getValWithDefault(config, 'ID_FILTER', 'exclude', "")
+
+    def get_filters(self):
+        #Acceptance filter as a list of (can_id, id_mask) for CanBusInterface.set_filters().
+        #The values may have been edited by hand in config.ini, so a bad one means accept all.
+        try:
+            filter_id = int(str(self.can_filter_id).strip() or "0", 16)
+            filter_mask = int(str(self.can_filter_mask).strip() or "0", 16)
+        except ValueError:
+            settings_log.warning("Ignoring acceptance filter id=%r mask=%r in %s, not hexadecimal numbers",
+                                 self.can_filter_id, self.can_filter_mask, self.SETTINGS_FNAME)
+            return []
+        if(not (0 <= filter_id <= 0x1FFFFFFF and 0 <= filter_mask <= 0x1FFFFFFF)):
+            settings_log.warning("Ignoring acceptance filter id=%r mask=%r in %s, not valid 29 bit CAN IDs",
+                                 self.can_filter_id, self.can_filter_mask, self.SETTINGS_FNAME)
+            return []
+        if(filter_mask == 0):
+            return []
+        return [(filter_id, filter_mask)]
 
     def save(self):
         config = configparser.ConfigParser()
@@ -57,6 +95,12 @@ class Settings():
         config['V7CAN_DEVICE']['can_use_extended_frame'] = str(self.can_use_extended_frame)
         config['V7CAN_DEVICE']['can_serial_baud'] = str(self.can_serial_baud)
         config['V7CAN_DEVICE']['can_serial_comport'] = str(self.can_serial_comport)
+        config['V7CAN_DEVICE']['can_filter_id'] = str(self.can_filter_id)
+        config['V7CAN_DEVICE']['can_filter_mask'] = str(self.can_filter_mask)
+
+        config['ID_FILTER'] = {}
+        config['ID_FILTER']['include'] = str(self.id_filter_include)
+        config['ID_FILTER']['exclude'] = str(self.id_filter_exclude)
 
         with open(self.SETTINGS_FNAME, 'w') as cfgfile:
             config.write(cfgfile)
@@ -86,6 +130,8 @@ class settingsDialogBox(tkinter.simpledialog.Dialog):
         Label(master, text="CAN Frame Size").grid(row=1)
         Label(master, text="CAN Serial Baudrate").grid(row=2)
         Label(master, text="CAN Serial Comport").grid(row=3)
+        Label(master, text="CAN Filter ID (hex)").grid(row=4)
+        Label(master, text="CAN Filter Mask (hex)").grid(row=5)
 
         self.can_baud_rate_options_sel_val = StringVar(master)
         self.can_extended_frame_options_sel_val = StringVar(master)
@@ -106,14 +152,64 @@ class settingsDialogBox(tkinter.simpledialog.Dialog):
         self.e2.grid(row=1, column=1)
         self.e3.grid(row=2, column=1)
         self.e4.grid(row=3, column=1)
+
+        self.e5 = Entry(master)
+        self.e6 = Entry(master)
+        self.e5.insert(0, str(self.settings.can_filter_id))
+        self.e6.insert(0, str(self.settings.can_filter_mask))
+        self.e5.grid(row=4, column=1)
+        self.e6.grid(row=5, column=1)
         return self.e1 # initial focus
 
+    def validate(self):
+        for entry in (self.e5, self.e6):
+            try:
+                value = int(entry.get().strip() or "0", 16)
+            except ValueError:
+                tkinter.messagebox.showinfo("Error", entry.get() + " could not be parsed to a hexadecimal number")
+                return False
+            if(value < 0 or value > 0x1FFFFFFF):
+                tkinter.messagebox.showinfo("Error", entry.get() + " is not a valid 29 bit CAN ID")
+                return False
+        return True
+
     def apply(self):
 
         self.settings.can_baud_rate = int(self.can_baud_rate_options_sel_val.get())
-        self.settings.can_use_extended_frame = bool(self.can_extended_frame_options_sel_val.get())
+        self.settings.can_use_extended_frame = (self.can_extended_frame_options_sel_val.get() == 'True')
         self.settings.can_serial_baud = int(self.can_serial_baudrate_options_sel_val.get())
         self.settings.can_serial_comport = str(self.can_serial_port_available_options_sel_val.get())
+        self.settings.can_filter_id = format(int(self.e5.get().strip() or "0", 16), 'X')
+        self.settings.can_filter_mask = format(int(self.e6.get().strip() or "0", 16), 'X')
 
 
+class idFilterDialogBox(tkinter.simpledialog.Dialog):
 
+    def __init__(self, parent, settings):
+        self.settings = settings
+        tkinter.simpledialog.Dialog.__init__(self, parent = parent, title = "ID Filter")
+
+    def body(self, master):
+        Label(master, text="Comma separated hex IDs, ranges (100-1FF) or compare/mask pairs (18F00400/1FFFFF00)").grid(row=0, columnspan=2)
+        Label(master, text="Include only").grid(row=1)
+        Label(master, text="Exclude").grid(row=2)
+
+        self.e1 = Entry(master, width=60)
+        self.e2 = Entry(master, width=60)
+        self.e1.insert(0, str(self.settings.id_filter_include))
+        self.e2.insert(0, str(self.settings.id_filter_exclude))
+        self.e1.grid(row=1, column=1)
+        self.e2.grid(row=2, column=1)
+        return self.e1 # initial focus
+
+    def validate(self):
+        try:
+            IdFilter.IdFilter(self.e1.get(), self.e2.get())
+        except ValueError as e:
+            tkinter.messagebox.showinfo("Error", "Filter could not be parsed: " + str(e))
+            return False
+        return True
+
+    def apply(self):
+        self.settings.id_filter_include = self.e1.get().strip()
+        self.settings.id_filter_exclude = self.e2.get().strip()
@@ -0,0 +1,159 @@
+##################################################################################################
+# Linux SocketCAN backend.
+#
+# Talks to any SocketCAN network interface: real controllers (can0) or the virtual vcan
+# driver, which is handy for running the viewer and the performance tests with no hardware:
+#   sudo modprobe vcan
+#   sudo ip link add dev vcan0 type vcan
+#   sudo ip link set up vcan0
+#
+# Compared with the serial adapter this gets:
+#  -- kernel receive timestamps (SO_TIMESTAMPNS), taken when the frame arrived, not when
+#     python got round to reading it
+#  -- acceptance filtering in the kernel (CAN_RAW_FILTER), so unwanted frames never reach python
+#  -- batched reads: receive() drains every queued frame from the non-blocking socket in one go
+#
+# The bus bitrate belongs to the network interface (ip link set can0 type can bitrate ...),
+# so set_config() only takes the frame format from the settings.
+##################################################################################################
+import socket
+import struct
+import time
+import logging
+
+import USBCanAnalyzerV7
+import CanBus
+
+socketcan_log = logging.getLogger(__name__)
+
+# From linux/can.h and asm-generic/socket.h. Not all of these are exported by the socket module.
+CAN_EFF_FLAG = 0x80000000
+CAN_RTR_FLAG = 0x40000000
+CAN_ERR_FLAG = 0x20000000
+CAN_EFF_MASK = 0x1FFFFFFF
+CAN_SFF_MASK = 0x000007FF
+SO_TIMESTAMPNS = 35
+SCM_TIMESTAMPNS = SO_TIMESTAMPNS
+
+# struct can_frame: can_id, len, 3 pad/reserved bytes, 8 data bytes
+CAN_FRAME_STRUCT = struct.Struct('=IB3x8s')
+TIMESPEC_STRUCT = struct.Struct('=qq')
+
+
+class SocketCanInterface(CanBus.CanBusInterface):
+
+    # Upper bound on frames drained per receive() call
+    MAX_PACKETS_PER_RECEIVE = 10000
+
+    def __init__(self, channel="vcan0", use_extended_frame=True):
+        CanBus.CanBusInterface.__init__(self)
+        self.channel = channel
+        self.use_extended_frame = use_extended_frame
+        self.sock = None
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+        self.ancbufsize = socket.CMSG_SPACE(TIMESPEC_STRUCT.size)
+
+    def open(self):
+        if(self.sock is not None):
+            socketcan_log.warning("Socket already open!")
+            return
+        self.sock = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.sock.bind((self.channel,))
+        self.sock.setblocking(False)
+        self._apply_filters()
+        self.capture_start_time = time.perf_counter_ns()
+        self.prev_capture_time = self.capture_start_time
+        self.capture_time_reset()
+        socketcan_log.info("Opened SocketCAN interface %s", self.channel)
+
+    def close(self):
+        if(self.sock is not None):
+            self.sock.close()
+            self.sock = None
+            socketcan_log.info("Closed SocketCAN interface %s", self.channel)
+
+    def is_open(self):
+        return self.sock is not None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud, filters=None):
+        self.use_extended_frame = use_extended_frame
+        if(filters is not None):
+            self.set_filters(filters)
+
+    def set_filters(self, filters):
+        CanBus.CanBusInterface.set_filters(self, filters)
+        if(self.sock is not None):
+            self._apply_filters()
+
+    def send(self, id, data):
+        if(not isinstance(id, int)):
+            id = int.from_bytes(id, byteorder='big')
+        if(len(data) > 8):
+            socketcan_log.error("Cannot send more than 8 bytes of data")
+            return
+        if(self.sock is None):
+            return
+        if(self.use_extended_frame or id > CAN_SFF_MASK):
+            id = (id & CAN_EFF_MASK) | CAN_EFF_FLAG
+        self.sock.send(CAN_FRAME_STRUCT.pack(id, len(data), bytes(data)))
+
+    def receive(self):
+        packet_list = []
+        if(self.sock is None):
+            return packet_list
+
+        recvmsg = self.sock.recvmsg
+        frame_size = CAN_FRAME_STRUCT.size
+        while(len(packet_list) < self.MAX_PACKETS_PER_RECEIVE):
+            try:
+                frame, ancdata, msg_flags, addr = recvmsg(frame_size, self.ancbufsize)
+            except BlockingIOError:
+                break
+            packet = self._make_packet(frame, ancdata)
+            if(packet is not None):
+                packet_list.append(packet)
+
+        self.log_received(packet_list)
+        return packet_list
+
+    #####################################################################
+    #PRIVATE Methods
+    #####################################################################
+
+    def _make_packet(self, frame, ancdata):
+        raw_id, dlc, data = CAN_FRAME_STRUCT.unpack(frame)
+        if(raw_id & (CAN_RTR_FLAG | CAN_ERR_FLAG)):
+            # Remote and error frames are not shown
+            return None
+
+        rx_time_ns = None
+        for cmsg_level, cmsg_type, cmsg_data in ancdata:
+            if(cmsg_level == socket.SOL_SOCKET and cmsg_type == SCM_TIMESTAMPNS):
+                sec, nsec = TIMESPEC_STRUCT.unpack(cmsg_data[:TIMESPEC_STRUCT.size])
+                # Kernel stamps are wall clock time; move them onto the perf_counter clock
+                rx_time_ns = sec * 1000000000 + nsec - USBCanAnalyzerV7.WALL_CLOCK_OFFSET_NS
+
+        if(raw_id & CAN_EFF_FLAG):
+            can_id = raw_id & CAN_EFF_MASK
+            flags = USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED
+        else:
+            can_id = raw_id & CAN_SFF_MASK
+            flags = 0
+
+        packet = USBCanAnalyzerV7.CanPacket(self.capture_start_time, self.prev_capture_time, can_id, dlc,
+                                            int.from_bytes(data[:dlc], byteorder='little'), flags, rx_time_ns)
+        self.prev_capture_time = packet.rx_time_ns
+        return packet
+
+    def _apply_filters(self):
+        # Hand the acceptance filters to the kernel. An empty filter list accepts everything.
+        if(self.filters):
+            filter_data = b''.join(struct.pack('=II', can_id, id_mask) for can_id, id_mask in self.filters)
+        else:
+            filter_data = struct.pack('=II', 0, 0)
+        self.sock.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, filter_data)
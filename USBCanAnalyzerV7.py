@@ -7,49 +7,208 @@
 # http://arduinoalternatorregulator.blogspot.com/2018/03/a-look-at-seedstudio-usb-can-analyzer.html
 
 import serial #Requires pySerial.
+import serial.threaded
 import datetime
+import time
+import collections
+import threading
+import logging
+
+import CanBus
+
+# Tracing is split per component so each can be turned up on its own, e.g.
+#   USBCanAnalyzerV7.set_trace_level('rx', logging.DEBUG)
+# All messages use lazy %-formatting, and the per-byte/per-packet hot paths
+# check isEnabledFor() once per update, so disabled tracing costs nothing.
+rx_log = logging.getLogger(__name__ + ".rx")
+tx_log = logging.getLogger(__name__ + ".tx")
+config_log = logging.getLogger(__name__ + ".config")
+
+TRACE_COMPONENTS = {'rx':rx_log, 'tx':tx_log, 'config':config_log}
+
+def set_trace_level(component, level):
+    TRACE_COMPONENTS[component].setLevel(level)
+
+def merge_filters(filters):
+    # Smallest single (id, mask) acceptance filter that passes everything the list of
+    # (id, mask) filters passes: keep only the bits every filter cares about and agrees on.
+    if(len(filters) == 0):
+        return (0, 0)
+    merged_id, merged_mask = filters[0]
+    merged_id &= merged_mask
+    for can_id, id_mask in filters[1:]:
+        merged_mask &= id_mask
+        merged_mask &= ~(merged_id ^ can_id)
+        merged_id &= merged_mask
+    return (merged_id & merged_mask, merged_mask)
+
+def can_frame_bits(extended, dlc):
+    # Longest a data frame can be on the wire, with worst case bit stuffing, plus the 3 bit
+    # interframe space. Used to pace transmission to what the bus can carry.
+    if(extended):
+        return 64 + 8 * dlc + (53 + 8 * dlc) // 4 + 3
+    return 44 + 8 * dlc + (33 + 8 * dlc) // 4 + 3
+
+# The session's one wall-clock anchor. Packet timestamps are perf_counter_ns() values, which
+# NTP adjustments cannot make jump; they are only converted to wall-clock time for display
+# and export, always through this anchor, so the conversion is the same for the whole session.
+WALL_CLOCK_ANCHOR = datetime.datetime.now()
+MONOTONIC_ANCHOR_NS = time.perf_counter_ns()
+# Add to a perf_counter_ns() timestamp to get ns since the epoch
+WALL_CLOCK_OFFSET_NS = time.time_ns() - MONOTONIC_ANCHOR_NS
 
 class CanPacket:
+    # One of these is kept per received frame, so it is kept small: __slots__
+    # instead of a __dict__, the ID and payload held as plain ints, and times
+    # as integer nanoseconds from the monotonic time.perf_counter_ns() clock.
+    #  -- can_id: the CAN ID
+    #  -- dlc: number of valid data bytes (0-8)
+    #  -- payload: the data bytes packed into one int, first byte in the low 8 bits
+    #  -- flags: FLAG_* bits
+    #  -- channel: which adapter/bus the frame came from, when capturing several at once
+    __slots__ = ('can_id', 'dlc', 'payload', 'flags', 'channel', 'rx_time_ns', 'start_time_ns', 'prev_time_ns')
+
+    FLAG_EXTENDED = 0x01
+
+    def __init__(self, start_time_ns, prev_time_ns, can_id=0, dlc=0, payload=0, flags=0, rx_time_ns=None, channel=0):
+        self.can_id = can_id
+        self.dlc = dlc
+        self.payload = payload
+        self.flags = flags
+        self.channel = channel
+        if(rx_time_ns is None):
+            rx_time_ns = time.perf_counter_ns()
+        self.rx_time_ns = rx_time_ns
+        self.start_time_ns = start_time_ns
+        self.prev_time_ns = prev_time_ns
+
+    @property
+    def id(self):
+        # Raw ID bytes as sent by the adapter, LSB first
+        if(self.flags & self.FLAG_EXTENDED):
+            return self.can_id.to_bytes(4, byteorder='little')
+        else:
+            return self.can_id.to_bytes(3, byteorder='little')
 
-    def __init__(self, starttime, prevtime):
-        self.id = bytearray()
-        self.data = bytearray()
-        self.rx_time = datetime.datetime.now()
-        self.start_time = starttime
-        self.prev_time = prevtime
-
-    def id_add_byte(self, byte_in):
-        self.id.append(byte_in)
-
-    def data_add_byte(self, byte_in):
-        self.data.append(byte_in)
+    @property
+    def data(self):
+        return self.payload.to_bytes(8, byteorder='little')[:self.dlc]
 
     def get_id_string(self):
-        ret_str = str()
-        ret_str += format(int.from_bytes(self.id, byteorder='little'), '#10X')
-        return ret_str
+        return format(self.can_id, '#10X')
 
     def get_data_string(self):
-        ret_str = str()
-        for byte in self.data :
-            ret_str +=" "
-            ret_str +=format(byte, '02X')
-        return ret_str
+        if(self.dlc == 0):
+            return ""
+        return " " + self.data.hex(" ").upper()
 
     def get_rx_time(self):
-        return self.rx_time
+        return WALL_CLOCK_ANCHOR + datetime.timedelta(microseconds=(self.rx_time_ns - MONOTONIC_ANCHOR_NS) // 1000)
+
+    def get_rx_time_ns(self):
+        return self.rx_time_ns
 
     def get_rx_time_delta_start(self):
-        return self.rx_time - self.start_time
+        return datetime.timedelta(microseconds=(self.rx_time_ns - self.start_time_ns) // 1000)
+
+    def get_rx_time_string(self):
+        # Seconds since capture start with microsecond resolution, formatted without floats
+        delta_us = (self.rx_time_ns - self.start_time_ns) // 1000
+        return "%d.%06d" % (delta_us // 1000000, delta_us % 1000000)
 
     def get_rx_time_delta_prev(self):
-        return self.rx_time - self.prev_time
+        return datetime.timedelta(microseconds=(self.rx_time_ns - self.prev_time_ns) // 1000)
 
     def __str__(self):
         return self.get_id_string() + " " + self.get_data_string()
 
 
-class DeviceInterface:
+class RxStats:
+    # Receive path counters, cheap enough to leave on: the framer bumps a few ints per read
+    # chunk and per error, and the latency histogram costs one bit_length() per packet.
+    #  -- bytes_read: raw bytes taken from the serial port
+    #  -- frames_parsed: complete frames framed out of them
+    #  -- bytes_discarded: bytes thrown away while hunting for the next frame start
+    #  -- errors: framing errors by kind (ERR_*)
+    #  -- backlog_high_water: most bytes seen waiting in the OS buffer at one read
+    #  -- update_limit_hits: updates that stopped at MAX_BYTES_PER_UPDATE with bytes still waiting
+    #  -- queue_dropped: frames lost because the RX thread's queue was full
+    #  -- latency_hist: time from a frame's timestamp to receive() returning it, bucket n
+    #     counting latencies below 2**n microseconds
+    __slots__ = ('bytes_read', 'frames_parsed', 'bytes_discarded', 'errors', 'backlog_high_water',
+                 'update_limit_hits', 'queue_dropped', 'latency_hist')
+
+    ERR_BAD_START = 'bad start'
+    ERR_BAD_COMMAND = 'bad command'
+    ERROR_KINDS = (ERR_BAD_START, ERR_BAD_COMMAND)
+
+    LATENCY_BUCKETS = 24
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.bytes_read = 0
+        self.frames_parsed = 0
+        self.bytes_discarded = 0
+        self.errors = dict.fromkeys(self.ERROR_KINDS, 0)
+        self.backlog_high_water = 0
+        self.update_limit_hits = 0
+        self.queue_dropped = 0
+        self.latency_hist = [0] * self.LATENCY_BUCKETS
+
+    def note_backlog(self, num_bytes):
+        if(num_bytes > self.backlog_high_water):
+            self.backlog_high_water = num_bytes
+
+    def note_latency(self, packet_list, now_ns):
+        hist = self.latency_hist
+        last_bucket = self.LATENCY_BUCKETS - 1
+        for packet in packet_list:
+            latency_us = (now_ns - packet.rx_time_ns) // 1000
+            bucket = latency_us.bit_length() if latency_us > 0 else 0
+            hist[bucket if bucket < last_bucket else last_bucket] += 1
+
+    def latency_percentile_us(self, fraction):
+        # Upper bound of the histogram bucket holding the given fraction of packets, or None
+        total = sum(self.latency_hist)
+        if(total == 0):
+            return None
+        running = 0
+        for bucket, count in enumerate(self.latency_hist):
+            running += count
+            if(running >= fraction * total):
+                return 1 << bucket
+        return 1 << (self.LATENCY_BUCKETS - 1)
+
+    def total_errors(self):
+        return sum(self.errors.values())
+
+    def summary(self):
+        # One line for a status bar
+        summary_str = "RX %d frames, %d kB" % (self.frames_parsed, self.bytes_read // 1024)
+        if(self.total_errors() > 0):
+            summary_str += ", %d framing errors (%s), %d B discarded" % (
+                self.total_errors(), ", ".join("%d %s" % (count, kind) for kind, count in self.errors.items() if count),
+                self.bytes_discarded)
+        summary_str += ", backlog max %d B" % self.backlog_high_water
+        if(self.update_limit_hits > 0):
+            summary_str += ", %d overrun updates" % self.update_limit_hits
+        if(self.queue_dropped > 0):
+            summary_str += ", %d dropped" % self.queue_dropped
+        p99_us = self.latency_percentile_us(0.99)
+        if(p99_us is not None):
+            summary_str += ", latency p50 < %s p99 < %s" % (format_us(self.latency_percentile_us(0.5)), format_us(p99_us))
+        return summary_str
+
+
+def format_us(time_us):
+    if(time_us >= 1000):
+        return "%d ms" % (time_us // 1000)
+    return "%d us" % time_us
+
+
+class DeviceInterface(CanBus.CanBusInterface):
 
     #####################################################################
     # CONSTANTS
@@ -63,6 +222,8 @@ class DeviceInterface:
     START_TOKEN_2=0xAA
     CMD_EXTENDED_MODE_TRANSFER = 0xE0
     CMD_STANDARD_MODE_TRANSFER = 0xC0
+    # The low nibble of a transfer command is the DLC; classic CAN carries at most 8 data bytes
+    CMD_MAX_DLC = 8
     CMD_CONFIGURE = 0x55
     CFG_EXTENDED_MODE = 0x02
     CFG_STANDARD_MODE = 0x01
@@ -70,15 +231,50 @@ class DeviceInterface:
 
     MAX_BYTES_PER_UPDATE = 10000
 
+    # Transmit packet header for each data length, so encoding a frame is a few slice copies
+    # (START_TOKEN_2, CMD_EXTENDED_MODE_TRANSFER|length; class attributes are out of scope here)
+    TX_HEADERS = [bytes([0xAA, 0xE0|num_bytes]) for num_bytes in range(9)]
+
+    # send_many() writes the frames it encodes into the TX buffer in one go once this many are queued
+    TX_QUEUE_MAX_FRAMES = 512
+    # With tx_pace set, frames are written in batches of about this much bus time, each one
+    # once the bus would have finished sending all but the previous batch. The wait for that
+    # happens without tx_lock held, so other senders are never held up by a paced burst.
+    TX_PACE_BATCH_NS = 2000000
+
+    # Serial link. At 100% load on a 1 Mbit bus the adapter sends up to ~130 kB/s, which only
+    # the 2000000 baud setting can carry; 115200 baud tops out around 11.5 kB/s.
+    SERIAL_BAUD_DEFAULT = 115200
+    SERIAL_BAUD_HIGH_SPEED = 2000000
+    # OS receive buffer requested where the driver allows it, about 1 s at 2 Mbaud
+    SERIAL_RX_BUFFER_SIZE = 262144
+
+    # Bulk read buffer. Grows if the OS ever reports more pending bytes than fit.
+    RX_BUFFER_INIT_SIZE = 16384
+
+    # Max packets held between receive() calls when the background RX thread is used.
+    RX_QUEUE_MAX_PACKETS = 100000
+
     # RX State Machine variables
     RX_expectedIDBytes = 0
     RX_expectedDataBytes = 0
-    RX_packetUnderConstruction = CanPacket(datetime.datetime.now(),datetime.datetime.now())
+    RX_packetUnderConstruction = CanPacket(0, 0)
     RX_packetList = []
 
     # settings variables
     use_extended_frame=True
 
+    # Acceptance filter loaded into the adapter: a message passes if
+    # (id & hw_filter_mask) == (hw_filter_id & hw_filter_mask). A mask of 0 passes everything.
+    hw_filter_id = 0
+    hw_filter_mask = 0
+    sw_filter_needed = False
+    use_bulk_read=True
+    use_rx_thread=False
+    # Hold send_many() back to the rate the CAN bus can carry the frames at, rather than
+    # writing them as fast as the serial link takes them and relying on the adapter to buffer
+    tx_pace=False
+
 
     #serial port object
     sp = None
@@ -87,99 +283,261 @@ class DeviceInterface:
     # PUBLIC API
     #####################################################################
 
-    def __init__(self, speed_kbps=1024, use_extended_frame=True, comport="COM5" ):
+    def __init__(self, speed_kbps=1024, use_extended_frame=True, comport="COM5", use_bulk_read=True, use_rx_thread=False, serial_baud=115200, channel=0):
+        CanBus.CanBusInterface.__init__(self)
+
+        # Tagged on every received packet, to tell adapters apart when capturing several
+        self.channel = channel
+
         #So far:
-        # --Filter unsupported
-        # --Mask unsupported
+        # --Filter/mask: one acceptance pair in the adapter, see set_filters()
         # --Mode hardcoded to "Normal"
         # --Frame type 
 
         if(speed_kbps not in self.SUPPORTED_SPEEDS):
-            print("Error: specified CAN speed " + speed_kbps + "kbps is not supported! Choose from " + str(self.SUPPORTED_SPEEDS.keys))
+            config_log.error("Specified CAN speed %skbps is not supported! Choose from %s", speed_kbps, list(self.SUPPORTED_SPEEDS.keys()))
             return
 
+        # Bulk read mode drains the whole OS buffer per update instead of one byte per read() call
+        self.use_bulk_read = use_bulk_read
+        self.rx_buffer = bytearray(self.RX_BUFFER_INIT_SIZE)
+        self.rx_buffer_len = 0
+
+        # Background RX thread mode runs the framer on a serial.threaded.ReaderThread,
+        # so capture keeps going even if receive() is not called for a while.
+        # Finished packets wait in a bounded deque.
+        self.use_rx_thread = use_rx_thread
+        self.rx_thread = None
+        self.rx_queue = collections.deque(maxlen=self.RX_QUEUE_MAX_PACKETS)
+
+        # Receive counters, see RxStats. Reset each time the port is opened.
+        self.rx_stats = RxStats()
+
+        # Guards the framer state (rx_buffer, rx_stats, timestamps): receive() and the RX thread
+        # use it while open(), close() and set_config() reset it, usually from another thread.
+        self.rx_lock = threading.Lock()
+
+        # Optional binary sink (any object with write(), e.g. a file opened 'wb').
+        # Every raw byte read from the adapter is written to it unformatted, one
+        # write() per read chunk.
+        self.raw_rx_trace = None
+
+        # Encoded frames not yet written, see queue_frame(). The lock lets other threads
+        # (e.g. a cyclic sender) transmit alongside the GUI.
+        self.tx_buffer = bytearray()
+        self.tx_buffer_frames = 0
+        self.tx_buffer_bits = 0
+        self.tx_bus_free_time = 0
+        self.tx_lock = threading.Lock()
+
         #Configure but do not open serial port
         if(self.sp is None):
-            self.sp = serial.Serial()
-            self.set_config(speed_kbps, use_extended_frame, comport, 115200)
+            self.set_config(speed_kbps, use_extended_frame, comport, serial_baud)
         return
 
-    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud):
+    def set_config(self, speed_kbps, use_extended_frame, comport, serial_baud, filters=None):
         self.use_extended_frame = use_extended_frame
-
-        if(self.sp is not None):
+        if(filters is not None):
+            self.set_filters(filters)
+
+        with self.rx_lock:
+            if(self.sp is None or not self.sp.is_open):
+                # serial_for_url() also takes pySerial URLs such as loop:// or socket://host:port
+                # (see serial/urlhandler), which is how the throughput test feeds in synthetic traffic
+                self.sp = serial.serial_for_url(comport, do_not_open=True)
+            # Changing these on an open port reopens it, so not while receive() is reading it
             self.sp.baudrate=serial_baud
             self.sp.port=comport
 
+        if(serial_baud > self.SERIAL_BAUD_DEFAULT and not self.use_bulk_read):
+            config_log.warning("The byte-at-a-time parser cannot keep up with a %d baud link at high bus load, use bulk read", serial_baud)
+
         self.speed = self.SUPPORTED_SPEEDS[speed_kbps]
-        self.rx_packet_byte_idx = 0
-        self.capture_start_time = datetime.datetime.now()
-        self.prev_capture_time = self.capture_start_time
+        # 1024 is the adapter's setting for 1 Mbit/s
+        self.bit_time_ns = 1000000 // min(speed_kbps, 1000)
+        with self.rx_lock:
+            # Time one byte takes on the serial link (start + 8 data + stop bits)
+            self.byte_time_ns = 10 * 1000000000 // serial_baud
+            self.rx_packet_byte_idx = 0
+            self.rx_buffer_len = 0
+            self.capture_start_time = time.perf_counter_ns()
+            self.prev_capture_time = self.capture_start_time
+            self.rx_prev_chunk_time = self.capture_start_time
+        self.capture_time_reset()
         return
 
     def open(self):
         if(self.sp is not None and not self.sp.is_open):
-            self.sp.open()
-            print("Serial port opened")
-            self.sendConfigPacket()
-            self.rx_packet_byte_idx = 0
-            self.capture_start_time = datetime.datetime.now()
-            print("Device configured")
+            with self.rx_lock:
+                self.sp.open()
+                if(hasattr(self.sp, 'set_buffer_size')):
+                    # Windows only: the default driver buffer holds a few ms of traffic at 2 Mbaud
+                    self.sp.set_buffer_size(rx_size=self.SERIAL_RX_BUFFER_SIZE)
+                config_log.info("Serial port opened")
+                self.sendConfigPacket()
+                self.rx_packet_byte_idx = 0
+                self.rx_buffer_len = 0
+                self.rx_stats.reset()
+                self.capture_start_time = time.perf_counter_ns()
+                self.prev_capture_time = self.capture_start_time
+                self.rx_prev_chunk_time = self.capture_start_time
+                self.rx_queue.clear()
+            self.capture_time_reset()
+            config_log.info("Device configured")
+            if(self.use_rx_thread):
+                self.rx_thread = serial.threaded.ReaderThread(self.sp, lambda: RxThreadProtocol(self))
+                self.rx_thread.start()
         else:
-            print("Port already open!")
+            config_log.warning("Port already open!")
         return
 
     def close(self):
+        if(self.rx_thread is not None):
+            self.rx_thread.stop()
+            self.rx_thread = None
         if(self.sp is not None and self.sp.is_open):
-            self.sp.close()
-            print("Serial port closed")
+            # Not in the middle of a receive()
+            with self.rx_lock:
+                self.sp.close()
+            config_log.info("Serial port closed")
         else:
-            print("Port already closed!")
+            config_log.debug("Port already closed!")
         return
 
     def is_open(self):
         return self.sp.is_open
 
+    def set_filters(self, filters):
+        # The adapter holds a single filter ID/mask pair. One pair is loaded as is. Several are
+        # merged into the tightest single pair that still passes all of them, and the exact
+        # set is then applied in software on the host.
+        CanBus.CanBusInterface.set_filters(self, filters)
+        self.hw_filter_id, self.hw_filter_mask = merge_filters(self.filters)
+        self.sw_filter_needed = len(self.filters) > 1
+        config_log.info("Acceptance filter id=%#x mask=%#x%s", self.hw_filter_id, self.hw_filter_mask,
+                        " plus software filtering" if self.sw_filter_needed else "")
+        if(self.sp is not None and self.sp.is_open):
+            self.sendConfigPacket()
+
 
     def send(self, id, data):
+        self.send_many(((id, data),))
+        return
+
+    def send_many(self, frames):
+        # frames is an iterable of (id, data). They are encoded into one buffer and written
+        # TX_QUEUE_MAX_FRAMES at a time (or in TX_PACE_BATCH_NS batches with tx_pace set),
+        # instead of one write per frame. tx_lock is only held while a batch is encoded and
+        # written, so other threads can send between batches. Returns the number of frames sent.
+        frames = iter(frames)
+        num_frames = 0
+        is_done = False
+        while(not is_done):
+            wait_ns = 0
+            with self.tx_lock:
+                if(self.tx_pace):
+                    # Let the bus get down to the previous batch before adding this one
+                    wait_ns = self.tx_bus_free_time - self.TX_PACE_BATCH_NS - time.perf_counter_ns()
+                if(wait_ns <= 0):
+                    is_done = True
+                    for id, data in frames:
+                        if(self.queue_frame(id, data)):
+                            num_frames += 1
+                        if(self.tx_batch_full()):
+                            is_done = False
+                            break
+                    self.flush_tx()
+            if(wait_ns > 0):
+                time.sleep(wait_ns / 1e9)
+        return num_frames
+
+    def queue_frame(self, id, data):
+        # Encode a frame onto the end of the TX buffer. Call with tx_lock held, and flush_tx()
+        # once tx_batch_full() or when done. Returns False for an invalid frame.
+        send_buf = self.encode_frame(id, data)
+        if(send_buf is None):
+            return False
+        self.tx_buffer += send_buf
+        self.tx_buffer_frames += 1
+        self.tx_buffer_bits += can_frame_bits(self.use_extended_frame, len(data))
+        return True
+
+    def tx_batch_full(self):
+        # Whether the TX buffer holds a whole batch. Call with tx_lock held.
+        if(self.tx_pace and self.tx_buffer_bits * self.bit_time_ns >= self.TX_PACE_BATCH_NS):
+            return True
+        return self.tx_buffer_frames >= self.TX_QUEUE_MAX_FRAMES
+
+    def flush_tx(self):
+        # Write everything queued by queue_frame() in one serial write. Call with tx_lock held;
+        # with tx_pace set, only once the pacing wait in send_many() has passed.
+        if(not self.tx_buffer_frames):
+            return
+        if(self.sp is not None and self.sp.is_open):
+            now = time.perf_counter_ns()
+            if(tx_log.isEnabledFor(logging.DEBUG)):
+                tx_log.debug("Sending %d packets %s", self.tx_buffer_frames, self.tx_buffer.hex(' '))
+            self.sp.write(self.tx_buffer)
+            self.tx_bus_free_time = max(now, self.tx_bus_free_time) + self.tx_buffer_bits * self.bit_time_ns
+        else:
+            tx_log.warning("Port not open, %d packets not sent", self.tx_buffer_frames)
+        self.tx_buffer = bytearray()
+        self.tx_buffer_frames = 0
+        self.tx_buffer_bits = 0
+
+    def encode_frame(self, id, data):
+        # Adapter packet transmitting one frame, or None (after logging why) if id or data
+        # are not valid
 
         if(self.use_extended_frame):
             expected_id_len = 4
         else:
             expected_id_len = 3
 
+        if(isinstance(id, int)):
+            if(id < 0 or id >= 1 << (8 * expected_id_len)):
+                tx_log.error("ID %#x does not fit in the %d ID bytes of a %s frame", id, expected_id_len,
+                             "extended" if self.use_extended_frame else "standard")
+                return None
+            id = id.to_bytes(expected_id_len, byteorder='big')
+
         if(len(id) != expected_id_len):
-            print("Err, Extended ID expected to be passed as a length " + str(expected_id_len) + "bytearray, MSB at index 0")
-            return
+            tx_log.error("ID expected to be passed as a length %d bytearray, MSB at index 0", expected_id_len)
+            return None
 
         num_bytes = len(data)
         if(num_bytes > 8):
-            print("Err, cannot send more than 8 bytes of data")
-            return
+            tx_log.error("Cannot send more than 8 bytes of data")
+            return None
 
-        if(self.sp is not None and self.sp.is_open):
-            # Init with required header
-            send_buf = bytearray([self.START_TOKEN_2, 
-                                  self.CMD_EXTENDED_MODE_TRANSFER|num_bytes,
-                                 ])
-            # Pack bytes LSB first
-            for byte in reversed(id):
-                send_buf.append(byte)
-            for byte in reversed(data):
-                send_buf.append(byte)
-
-            # Yet another magic byte determined from reverse engineering the sample program's output
-            send_buf.append(self.TX_MAGIC_BYTE_FINAL)
+        # Init with required header
+        send_buf = bytearray(self.TX_HEADERS[num_bytes])
+        # Pack bytes LSB first
+        send_buf += bytes(id)[::-1]
+        send_buf += bytes(data)[::-1]
 
-            # Send data
-            print("Sending packet " + str(send_buf))
-            self.sp.write(send_buf)
-        return
+        # Yet another magic byte determined from reverse engineering the sample program's output
+        send_buf.append(self.TX_MAGIC_BYTE_FINAL)
+        return send_buf
 
     def receive(self):
-        self.RX_packetList = []
-        self.rx_state_machine_update()
-        return self.RX_packetList
+        with self.rx_lock:
+            self.RX_packetList = []
+            if(self.use_rx_thread):
+                # Just drain whatever the RX thread has framed so far
+                rx_queue = self.rx_queue
+                for _ in range(len(rx_queue)):
+                    self.RX_packetList.append(rx_queue.popleft())
+            else:
+                self.rx_state_machine_update()
+            if(self.RX_packetList):
+                self.rx_stats.note_latency(self.RX_packetList, time.perf_counter_ns())
+            if(self.sw_filter_needed):
+                # The adapter's single filter only narrowed things down, finish the job here
+                self.RX_packetList = self.filter_packets(self.RX_packetList)
+            packet_list = self.RX_packetList
+        self.log_received(packet_list)
+        return packet_list
 
 
 
@@ -202,16 +560,9 @@ class DeviceInterface:
                 send_buf.append(self.CFG_EXTENDED_MODE)
             else:
                 send_buf.append(self.CFG_STANDARD_MODE)
-            #Filter not supported
-            send_buf.append(0x00)
-            send_buf.append(0x00)
-            send_buf.append(0x00)
-            send_buf.append(0x00)
-            #Mask not supported
-            send_buf.append(0x00)
-            send_buf.append(0x00)
-            send_buf.append(0x00)
-            send_buf.append(0x00)
+            #Pack acceptance filter ID and mask, LSB first like the IDs of data packets
+            send_buf += (self.hw_filter_id & 0xFFFFFFFF).to_bytes(4, byteorder='little')
+            send_buf += (self.hw_filter_mask & 0xFFFFFFFF).to_bytes(4, byteorder='little')
             #Hardcode mode to Normal? Set to 0x01 to get loopback mode
             send_buf.append(0x00)
             #Send magic byte (may have to be 0x01?)
@@ -231,10 +582,162 @@ class DeviceInterface:
             send_buf.append(checksum)
 
             # Send data
-            print("Sending packet " + str(send_buf))
+            config_log.debug("Sending config packet %s", send_buf)
             self.sp.write(send_buf)
 
     def rx_state_machine_update(self):
+        if(self.use_bulk_read):
+            self.rx_bulk_update()
+        else:
+            self.rx_bytewise_update()
+
+    def rx_bulk_update(self):
+        # Drain everything the OS has buffered with a single read into the
+        # reusable rx_buffer, after any partial frame left over from last time.
+        if(self.sp is None or not self.sp.is_open):
+            return
+
+        num_waiting = self.sp.in_waiting
+        if(num_waiting == 0):
+            return
+        self.rx_stats.note_backlog(num_waiting)
+
+        needed = self.rx_buffer_len + num_waiting
+        if(needed > len(self.rx_buffer)):
+            self.rx_buffer.extend(bytes(needed - len(self.rx_buffer)))
+
+        view = memoryview(self.rx_buffer)
+        num_read = self.sp.readinto(view[self.rx_buffer_len:needed])
+        chunk_time_ns = time.perf_counter_ns()
+
+        if(self.raw_rx_trace is not None):
+            self.raw_rx_trace.write(view[self.rx_buffer_len:self.rx_buffer_len + num_read])
+        view.release()
+
+        self.rx_buffer_len += num_read
+        self.rx_stats.bytes_read += num_read
+        self.rx_consume_buffer(self.RX_packetList, chunk_time_ns)
+
+    def rx_feed(self, data):
+        # Frame a chunk handed to us by the RX thread and queue the packets for receive()
+        packet_list = []
+        with self.rx_lock:
+            self.rx_frame_chunk(data, packet_list)
+            if(packet_list):
+                free_slots = self.rx_queue.maxlen - len(self.rx_queue)
+                if(len(packet_list) > free_slots):
+                    # The deque discards the oldest packets to make room; keep count of them
+                    self.rx_stats.queue_dropped += len(packet_list) - free_slots
+                self.rx_queue.extend(packet_list)
+
+    def rx_frame_chunk(self, data, packet_list):
+        # Append a chunk read by someone else (RX thread, asyncio transport), then frame it
+        chunk_time_ns = time.perf_counter_ns()
+        if(self.raw_rx_trace is not None):
+            self.raw_rx_trace.write(data)
+        # Readers take everything pending at once, so the chunk size is the backlog
+        self.rx_stats.bytes_read += len(data)
+        self.rx_stats.note_backlog(len(data))
+        needed = self.rx_buffer_len + len(data)
+        if(needed > len(self.rx_buffer)):
+            self.rx_buffer.extend(bytes(needed - len(self.rx_buffer)))
+        self.rx_buffer[self.rx_buffer_len:needed] = data
+        self.rx_buffer_len = needed
+        self.rx_consume_buffer(packet_list, chunk_time_ns)
+
+    def rx_consume_buffer(self, packet_list, chunk_time_ns):
+        consumed = self.rx_parse_buffer(self.rx_buffer, self.rx_buffer_len, packet_list, chunk_time_ns)
+
+        #Keep any incomplete trailing frame at the front of the buffer for next time
+        remaining = self.rx_buffer_len - consumed
+        if(remaining > 0 and consumed > 0):
+            self.rx_buffer[0:remaining] = self.rx_buffer[consumed:self.rx_buffer_len]
+        self.rx_buffer_len = remaining
+
+    def rx_parse_buffer(self, buf, buf_len, packet_list, chunk_time_ns):
+        # Walk buf[0:buf_len] by index and append every complete packet found to
+        # packet_list. Returns the number of bytes consumed. Bytes of a trailing
+        # incomplete packet are not consumed, so the caller can retry once more arrive.
+        #
+        # chunk_time_ns is when the read that filled buf up to buf_len returned. The bytes
+        # came in back to back at the serial rate, so each packet is stamped with the time its
+        # last byte arrived: chunk_time_ns less byte_time_ns for every byte after it. That
+        # is never earlier than the previous read (those bytes were not there yet) nor the
+        # previous packet.
+        byte_time_ns = self.byte_time_ns
+        earliest_time_ns = max(self.rx_prev_chunk_time, self.prev_capture_time)
+        self.rx_prev_chunk_time = chunk_time_ns
+        idx = 0
+        stats = self.rx_stats
+        num_packets_before = len(packet_list)
+        trace_packets = rx_log.isEnabledFor(logging.DEBUG)
+        while(idx < buf_len):
+            if(buf[idx] != self.START_TOKEN_1):
+                #Discard bytes till the start marker
+                start_idx = buf.find(self.START_TOKEN_1, idx, buf_len)
+                if(start_idx < 0):
+                    stats.bytes_discarded += buf_len - idx
+                    idx = buf_len
+                    break
+                stats.bytes_discarded += start_idx - idx
+                idx = start_idx
+
+            if(idx + 3 > buf_len):
+                #Header not fully received yet
+                break
+
+            if(buf[idx + 1] != self.START_TOKEN_2):
+                if(trace_packets):
+                    rx_log.debug("Error in packet RX: Got %#04X but was expecting %#04X", buf[idx + 1], self.START_TOKEN_2)
+                stats.errors[RxStats.ERR_BAD_START] += 1
+                stats.bytes_discarded += 1
+                idx += 1
+                continue
+
+            cmd_byte = buf[idx + 2]
+            dlc = cmd_byte & 0x0F
+            # A DLC of 9-15 is not a frame header either, so it is resynced like any bad command
+            cmd_type = cmd_byte & 0xF0 if dlc <= self.CMD_MAX_DLC else None
+            if(cmd_type == self.CMD_STANDARD_MODE_TRANSFER):
+                num_id_bytes = 3
+                flags = 0
+            elif(cmd_type == self.CMD_EXTENDED_MODE_TRANSFER):
+                num_id_bytes = 4
+                flags = CanPacket.FLAG_EXTENDED
+            else:
+                if(trace_packets):
+                    rx_log.debug("Error in packet RX: Unknown command byte %#04X", cmd_byte)
+                stats.errors[RxStats.ERR_BAD_COMMAND] += 1
+                stats.bytes_discarded += 1
+                idx += 1
+                continue
+
+            id_start = idx + 3
+            data_start = id_start + num_id_bytes
+            packet_end = data_start + dlc
+            if(packet_end > buf_len):
+                #Wait for the rest of this packet
+                break
+
+            rx_time_ns = chunk_time_ns - (buf_len - packet_end) * byte_time_ns
+            if(rx_time_ns < earliest_time_ns):
+                rx_time_ns = earliest_time_ns
+            new_packet = CanPacket(self.capture_start_time, self.prev_capture_time,
+                                   int.from_bytes(buf[id_start:data_start], byteorder='little'),
+                                   dlc,
+                                   int.from_bytes(buf[data_start:packet_end], byteorder='little'),
+                                   flags, rx_time_ns, self.channel)
+            packet_list.append(new_packet)
+            self.prev_capture_time = rx_time_ns
+            earliest_time_ns = rx_time_ns
+            if(trace_packets):
+                rx_log.debug("RX packet %s", new_packet)
+            idx = packet_end
+
+        stats.frames_parsed += len(packet_list) - num_packets_before
+        return idx
+
+    def rx_bytewise_update(self):
 
         #Helper utility to check for a received byte matching the expected protocol
         def rx_check(actual, expected, reset_on_err=True):
@@ -243,26 +746,38 @@ class DeviceInterface:
                 return True
             else:
                 if(reset_on_err):
-                    #print("Error in packet RX: Got " + format(actual, '#04X') + " but was expecting " + format(expected, '#04X'))
+                    if(trace_bytes):
+                        rx_log.debug("Error in packet RX: Got %#04X but was expecting %#04X", actual, expected)
+                    stats.errors[RxStats.ERR_BAD_START] += 1
+                    stats.bytes_discarded += self.rx_packet_byte_idx + 1
                     self.rx_packet_byte_idx = 0
                 return False
 
         byte_counter = 0
+        stats = self.rx_stats
+        trace_bytes = rx_log.isEnabledFor(logging.DEBUG)
 
         if(self.sp is not None and self.sp.is_open):
+            stats.note_backlog(self.sp.in_waiting)
             #As long as we have at least one packet, read it.
             while(self.sp.in_waiting != 0 and byte_counter < self.MAX_BYTES_PER_UPDATE): 
 
                 byte_counter += 1
 
                 #Read exactly one byte out of the serial port buffer
-                new_byte = int.from_bytes(self.sp.read(size=1), byteorder='little')
-                print(str(self.rx_packet_byte_idx) + " " + format(new_byte,'#04x'))
+                raw_byte = self.sp.read(size=1)
+                stats.bytes_read += 1
+                new_byte = int.from_bytes(raw_byte, byteorder='little')
+                if(self.raw_rx_trace is not None):
+                    self.raw_rx_trace.write(raw_byte)
+                if(trace_bytes):
+                    rx_log.debug("%d %#04x", self.rx_packet_byte_idx, new_byte)
 
                 # Handle this byte based on which byte we are currently on
                 if(self.rx_packet_byte_idx == 0):
                     if(int(new_byte) != self.START_TOKEN_1):
                         #Discard bytes till the start marker 
+                        stats.bytes_discarded += 1
                         continue
 
                 # Process the byte, using the rx idx to know how to interpret this byte
@@ -275,56 +790,88 @@ class DeviceInterface:
                     rx_check(new_byte,self.START_TOKEN_2)
 
                 elif(self.rx_packet_byte_idx == 2):
-                    #MessageID length and data length byte
-                    if(rx_check(new_byte&0xF0,self.CMD_STANDARD_MODE_TRANSFER,False)):
+                    #MessageID length and data length byte; a DLC over 8 is a bad command byte
+                    dlc_ok = (new_byte&0x0F) <= self.CMD_MAX_DLC
+                    if(dlc_ok and rx_check(new_byte&0xF0,self.CMD_STANDARD_MODE_TRANSFER,False)):
                         #Standard Packet incoming
                         self.RX_expectedIDBytes = 3
                         self.RX_expectedDataBytes = int(new_byte&0x0F)
-                    elif(rx_check(new_byte&0xF0,self.CMD_EXTENDED_MODE_TRANSFER,False)):
+                    elif(dlc_ok and rx_check(new_byte&0xF0,self.CMD_EXTENDED_MODE_TRANSFER,False)):
                         #Extended packet incoming
                         self.RX_expectedIDBytes = 4
                         self.RX_expectedDataBytes = int(new_byte&0x0F)
                     else:
+                        if(trace_bytes):
+                            rx_log.debug("Error in packet RX: Unknown command byte %#04X", new_byte)
+                        stats.errors[RxStats.ERR_BAD_COMMAND] += 1
+                        stats.bytes_discarded += 3
                         self.rx_packet_byte_idx = 0
                         continue
 
-                    self.RX_packetUnderConstruction = CanPacket(self.capture_start_time, self.prev_capture_time)
+                    self.RX_packetUnderConstruction = CanPacket(self.capture_start_time, self.prev_capture_time, channel=self.channel)
+                    if(self.RX_expectedIDBytes == 4):
+                        self.RX_packetUnderConstruction.flags = CanPacket.FLAG_EXTENDED
                     #print(" --Expecting " + str(self.RX_expectedIDBytes) + " ID Bytes")
                     #print(" --Expecting " + str(self.RX_expectedDataBytes) + " data bytes")
 
                 elif(self.rx_packet_byte_idx in range(3, 3 + self.RX_expectedIDBytes)):
                     # MessageID bytes
-                    self.RX_packetUnderConstruction.id_add_byte(new_byte)
+                    self.RX_packetUnderConstruction.can_id |= new_byte << (8 * (self.rx_packet_byte_idx - 3))
                     self.rx_packet_byte_idx += 1
 
                 elif(self.rx_packet_byte_idx in range(3 + self.RX_expectedIDBytes, 3 + self.RX_expectedIDBytes + self.RX_expectedDataBytes )):
                     # Data Bytes
                     if(self.RX_expectedDataBytes != 0):
                         #Receiving Data
-                        self.RX_packetUnderConstruction.data_add_byte(new_byte)
+                        self.RX_packetUnderConstruction.payload |= new_byte << (8 * self.RX_packetUnderConstruction.dlc)
+                        self.RX_packetUnderConstruction.dlc += 1
                         self.rx_packet_byte_idx += 1
 
                         if(self.rx_packet_byte_idx >= (3 + self.RX_expectedIDBytes + self.RX_expectedDataBytes)):
-                            #Done receiving
+                            #Done receiving, stamp with the time the last byte was read
+                            self.RX_packetUnderConstruction.rx_time_ns = time.perf_counter_ns()
                             self.RX_packetList.append(self.RX_packetUnderConstruction)
-                            self.prev_capture_time = datetime.datetime.now()
+                            stats.frames_parsed += 1
+                            self.prev_capture_time = self.RX_packetUnderConstruction.rx_time_ns
                             self.rx_packet_byte_idx = 0
                             #print(self.RX_packetList)
                     else:
                         #No bytes sent. All done.
+                        self.RX_packetUnderConstruction.rx_time_ns = time.perf_counter_ns()
                         self.RX_packetList.append(self.RX_packetUnderConstruction)
-                        self.prev_capture_time = datetime.datetime.now()
+                        stats.frames_parsed += 1
+                        self.prev_capture_time = self.RX_packetUnderConstruction.rx_time_ns
                         self.rx_packet_byte_idx = 0
 
                 else:
-                    print("Developers goofed up???")
+                    rx_log.error("Developers goofed up???")
                     self.rx_packet_byte_idx = 0
 
+            if(byte_counter >= self.MAX_BYTES_PER_UPDATE and self.sp.in_waiting != 0):
+                # Out of budget for this update with bytes still queued: the backlog is growing
+                stats.update_limit_hits += 1
+
     def __del__(self):
         self.close()
+        self.stop_capture_log()
         return
 
     def sendTestPacket(self):
         self.send(bytearray([0x01, 0x02, 0x03, 0x04]), bytearray([0x01, 0x02, 0x03, 0x04, 0x05, 0x6, 0x07, 0x08]))
 
 
+class RxThreadProtocol(serial.threaded.Protocol):
+    # Glue between serial.threaded.ReaderThread and the DeviceInterface framer.
+    # Everything here runs on the reader thread.
+
+    def __init__(self, device):
+        self.device = device
+
+    def data_received(self, data):
+        self.device.rx_feed(data)
+
+    def connection_lost(self, exc):
+        if(exc is not None):
+            rx_log.error("RX thread stopped: %s", exc)
+
+
@@ -0,0 +1,72 @@
+# Memory and construction cost of CanPacket compared with the original
+# bytearray/datetime based packet class, for a long capture held in a list.
+#
+# Usage: python benchmarks/bench_canpacket_memory.py [num_frames]
+
+import os, sys, time, datetime, tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+
+
+class LegacyCanPacket:
+    # The packet class as it was before the compact representation
+    def __init__(self, starttime, prevtime):
+        self.id = bytearray()
+        self.data = bytearray()
+        self.rx_time = datetime.datetime.now()
+        self.start_time = starttime
+        self.prev_time = prevtime
+
+    def id_add_byte(self, byte_in):
+        self.id.append(byte_in)
+
+    def data_add_byte(self, byte_in):
+        self.data.append(byte_in)
+
+
+def build_legacy(num_frames):
+    start = datetime.datetime.now()
+    prev = start
+    packets = []
+    for i in range(num_frames):
+        pkt = LegacyCanPacket(start, prev)
+        for byte in (i & 0x1FFFFFFF).to_bytes(4, 'little'):
+            pkt.id_add_byte(byte)
+        for k in range(8):
+            pkt.data_add_byte((i + k) & 0xFF)
+        packets.append(pkt)
+        prev = pkt.rx_time
+    return packets
+
+
+def build_compact(num_frames):
+    start = time.perf_counter_ns()
+    prev = start
+    packets = []
+    for i in range(num_frames):
+        payload = int.from_bytes(bytes([(i + k) & 0xFF for k in range(8)]), 'little')
+        pkt = USBCanAnalyzerV7.CanPacket(start, prev, i & 0x1FFFFFFF, 8, payload, USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED)
+        packets.append(pkt)
+        prev = pkt.rx_time_ns
+    return packets
+
+
+def measure(builder, num_frames):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    packets = builder(num_frames)
+    elapsed = time.perf_counter() - t0
+    used, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del packets
+    return used, elapsed
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+
+    for label, builder in (("legacy", build_legacy), ("compact", build_compact)):
+        used, elapsed = measure(builder, num_frames)
+        print("%-8s %8d frames: %8.1f MB, %6.1f bytes/frame, built in %6.3f s" %
+              (label, num_frames, used / 1e6, used / num_frames, elapsed))
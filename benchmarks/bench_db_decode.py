@@ -0,0 +1,81 @@
+# Frames decoded per second against database size, comparing:
+#  -- objects: walking the msgInterpreter/dataInterpreter objects without stopping at the first match
+#  -- plan: a linear scan of the compiled decode plan with first-match exit
+#  -- indexed: dbProcessor.decode, which uses the mask buckets and the per-ID LRU cache
+#  -- batch: dbProcessor.decode_batch over numpy arrays of the same frames (requires numpy)
+#
+# Usage: python benchmarks/bench_db_decode.py
+
+import os, sys, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import numpy as np
+import Database
+
+SIGNALS_PER_MESSAGE = 8
+
+
+def make_db(num_messages):
+    db = Database.dbProcessor()
+    db.msgInterpreterList = []
+    for msg_idx in range(num_messages):
+        msgInt = Database.msgInterpreter(0x1FFFFFFF, 0x18F00000 + msg_idx, 8, "Msg" + str(msg_idx))
+        for sig_idx in range(SIGNALS_PER_MESSAGE):
+            msgInt.addDataInterpreter("Sig" + str(sig_idx), "data", 0xFF << (8 * sig_idx), 8 * sig_idx, 0.5, -10.0)
+        db.msgInterpreterList.append(msgInt)
+    db.compile()
+    return db
+
+
+def make_frames(num_messages, num_frames):
+    rng = random.Random(1234)
+    return [(0x18F00000 + rng.randrange(num_messages), rng.getrandbits(64)) for _ in range(num_frames)]
+
+
+def decode_objects(db, frames):
+    for can_id, payload in frames:
+        retval = None
+        for msgInt in db.msgInterpreterList:
+            if(msgInt.checkID(can_id, 8)):
+                retval = {'name':msgInt.name, 'data':{}}
+                for dataint in msgInt.dataInterpreters:
+                    retval['data'].update(dataint.interpret(can_id, payload))
+
+
+def decode_plan(db, frames):
+    for can_id, payload in frames:
+        for id_mask, id_compare, exp_data_len, name, elements in db.decodePlan:
+            if((can_id & id_mask) == id_compare and exp_data_len == 8):
+                values = []
+                for elem_name, source, mask, downshift, scale, offset in elements:
+                    working_val = can_id if source == Database.SOURCE_ID else payload
+                    values.append((elem_name, ((working_val & mask) >> downshift) * scale + offset))
+                break
+
+
+def decode_indexed(db, frames):
+    decode = db.decode
+    for can_id, payload in frames:
+        decode(can_id, payload, 8)
+
+
+def decode_batch(db, frames):
+    ids = np.fromiter((f[0] for f in frames), dtype=np.uint32, count=len(frames))
+    payloads = np.fromiter((f[1] for f in frames), dtype=np.uint64, count=len(frames))
+    db.decode_batch(ids, payloads, np.full(len(frames), 8))
+
+
+def rate(func, db, frames):
+    start = time.perf_counter()
+    func(db, frames)
+    return len(frames) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print("%10s %18s %18s %18s %18s" % ("messages", "objects frames/s", "plan frames/s", "indexed frames/s", "batch frames/s"))
+    for num_messages in (10, 100, 500, 2000):
+        db = make_db(num_messages)
+        frames = make_frames(num_messages, max(2000, 200000 // num_messages))
+        print("%10d %18.0f %18.0f %18.0f %18.0f" % (num_messages, rate(decode_objects, db, frames),
+                                                  rate(decode_plan, db, frames), rate(decode_indexed, db, frames),
+                                                  rate(decode_batch, db, frames)))
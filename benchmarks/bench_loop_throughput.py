@@ -0,0 +1,149 @@
+# End-to-end receive throughput test over the pySerial loop:// URL handler.
+#
+# A feeder thread plays the adapter: it writes a synthetic adapter byte stream into a
+# loop:// port at the pace a CAN bus running at 100% load would produce it, while
+# DeviceInterface reads the same port the way the GUI's receive thread does. Every frame
+# carries a sequence number, so lost, duplicated or corrupted frames are detected.
+#
+# A real adapter has a few kB of buffering at most, so the test also fails if the receiver
+# ever lets the loop port's 4 kB buffer fill up (the most bytes found waiting at one read,
+# rx_stats.backlog_high_water, reaches its size), as the feeder then has to wait. How far the
+# feeder fell behind the bus schedule is only printed: it also counts the feeder thread's
+# own scheduling delays, which on a loaded machine say nothing about the receiver.
+#
+# The defaults are 1 Mbit CAN with extended 8-byte frames, the most adapter bytes per second.
+# --standard --dlc 0 gives the highest frame rate instead.
+#
+# Usage: python benchmarks/bench_loop_throughput.py [--seconds 5] [--rx-thread]
+#        [--standard] [--dlc 8] [--serial-baud 2000000] [--can-kbps 1024]
+# Exits with status 1 if the test fails.
+
+import os, sys, time, threading, argparse
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+
+# The feeder writes whatever is due every FEED_INTERVAL_S
+FEED_INTERVAL_S = 0.001
+POLL_INTERVAL_S = 0.002
+# Length of the config packet DeviceInterface.open() sends
+CONFIG_PACKET_BYTES = 20
+
+
+def can_frame_bits(extended, dlc):
+    # Length on the wire of a data frame without stuff bits, plus the 3 bit interframe space.
+    # Back to back frames of this length are 100% bus load at the highest frame rate.
+    if(extended):
+        return 67 + 8 * dlc + 3
+    return 47 + 8 * dlc + 3
+
+
+def make_frame(seq, extended, dlc):
+    # The sequence number goes in the ID, and in the data if there is room for it
+    if(extended):
+        header = bytes([0x55, 0xAA, 0xE0 | dlc]) + (seq & 0x1FFFFFFF).to_bytes(4, 'little')
+    else:
+        header = bytes([0x55, 0xAA, 0xC0 | dlc]) + (seq & 0x7FF).to_bytes(3, 'little')
+    return header + (seq & ((1 << (8 * dlc)) - 1)).to_bytes(dlc, 'little')
+
+
+class Feeder(threading.Thread):
+
+    def __init__(self, port, num_frames, frame_period_s, extended, dlc):
+        super().__init__()
+        self.daemon = True
+        self.port = port
+        self.num_frames = num_frames
+        self.frame_period_s = frame_period_s
+        self.extended = extended
+        self.dlc = dlc
+        self.max_lag_s = 0.0
+        self.bytes_sent = 0
+
+    def run(self):
+        start = time.perf_counter()
+        seq = 0
+        while(seq < self.num_frames):
+            now = time.perf_counter()
+            due = min(self.num_frames, int((now - start) / self.frame_period_s) + 1)
+            if(due > seq):
+                # How far behind the bus we are: the oldest frame released now was due at seq * period
+                self.max_lag_s = max(self.max_lag_s, now - start - seq * self.frame_period_s)
+                chunk = b''.join(make_frame(i, self.extended, self.dlc) for i in range(seq, due))
+                self.port.write(chunk)
+                self.bytes_sent += len(chunk)
+                seq = due
+            time.sleep(FEED_INTERVAL_S)
+
+
+def run(args):
+    extended = not args.standard
+    frame_period_s = can_frame_bits(extended, args.dlc) / (args.can_kbps * 1000)
+    num_frames = int(args.seconds / frame_period_s)
+    frame_bytes = len(make_frame(0, extended, args.dlc))
+    link_bytes_per_s = args.serial_baud / 10
+    stream_bytes_per_s = frame_bytes / frame_period_s
+
+    print("CAN %d kbit/s at 100%% load: %s %d byte frames, %.0f frames/s, %.1f kB/s over a %d baud link (%.0f%% of it)" %
+          (args.can_kbps, "extended" if extended else "standard", args.dlc, 1 / frame_period_s,
+           stream_bytes_per_s / 1e3, args.serial_baud, 100 * stream_bytes_per_s / link_bytes_per_s))
+    if(stream_bytes_per_s > link_bytes_per_s):
+        print("FAIL: the serial link cannot carry this bus load")
+        return False
+
+    dev = USBCanAnalyzerV7.DeviceInterface(args.can_kbps, extended, "loop://", use_rx_thread=args.rx_thread,
+                                           serial_baud=args.serial_baud)
+    dev.open()
+    # The config packet the device just sent is looped straight back; it is not CAN traffic.
+    # With --rx-thread the reader may already have it, so rather than flushing the port, let
+    # the receive path take it and then start the framing statistics from zero.
+    deadline = time.perf_counter() + 1
+    while(dev.rx_stats.bytes_read < CONFIG_PACKET_BYTES and time.perf_counter() < deadline):
+        dev.receive()
+        time.sleep(POLL_INTERVAL_S)
+    with dev.rx_lock:
+        dev.rx_buffer_len = 0
+        dev.rx_stats.reset()
+
+    feeder = Feeder(dev.sp, num_frames, frame_period_s, extended, args.dlc)
+    next_seq = 0
+    errors = 0
+    start = time.perf_counter()
+    feeder.start()
+    deadline = start + args.seconds + 5
+    id_mask = 0x1FFFFFFF if extended else 0x7FF
+    while(next_seq < num_frames and time.perf_counter() < deadline):
+        for packet in dev.receive():
+            if(packet.can_id != next_seq & id_mask or packet.dlc != args.dlc or
+               packet.payload != next_seq & ((1 << (8 * args.dlc)) - 1)):
+                errors += 1
+            next_seq += 1
+        time.sleep(POLL_INTERVAL_S)
+    elapsed = time.perf_counter() - start
+    feeder.join(1)
+    loop_buffer_bytes = dev.sp.buffer_size
+    dev.close()
+    buffer_full = dev.rx_stats.backlog_high_water >= loop_buffer_bytes
+
+    lost = num_frames - next_seq
+    print("received %d of %d frames in %.2f s (%.0f frames/s), %d corrupt, %d lost, %d dropped from the RX queue" %
+          (next_seq, num_frames, elapsed, next_seq / elapsed, errors, lost, dev.rx_stats.queue_dropped))
+    print(dev.rx_stats.summary())
+    print("loop buffer: at most %d of %d bytes waiting%s, feeder max lag behind the bus %.1f ms" %
+          (dev.rx_stats.backlog_high_water, loop_buffer_bytes, " (FULL)" if buffer_full else "", feeder.max_lag_s * 1e3))
+
+    passed = (errors == 0 and lost == 0 and dev.rx_stats.queue_dropped == 0 and dev.rx_stats.total_errors() == 0 and
+              not buffer_full)
+    print("PASS" if passed else "FAIL")
+    return passed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Receive throughput test over loop://")
+    parser.add_argument('--seconds', type=float, default=5.0, help="length of the simulated bus traffic")
+    parser.add_argument('--can-kbps', type=int, default=1024, help="CAN bus speed, as in the settings dialog")
+    parser.add_argument('--serial-baud', type=int, default=USBCanAnalyzerV7.DeviceInterface.SERIAL_BAUD_HIGH_SPEED)
+    parser.add_argument('--standard', action='store_true', help="standard instead of extended frames")
+    parser.add_argument('--dlc', type=int, default=8, choices=range(9))
+    parser.add_argument('--rx-thread', action='store_true', help="receive on the background RX thread")
+    sys.exit(0 if run(parser.parse_args()) else 1)
@@ -0,0 +1,76 @@
+# Throughput comparison of the RX framer: the legacy one-byte-per-read() loop
+# against the bulk read path that drains in_waiting into a reusable buffer.
+#
+# A synthetic adapter byte stream is served from memory, so the numbers show
+# framer + per-call overhead without depending on a real device being attached.
+#
+# Usage: python benchmarks/bench_rx_framer.py [num_frames]
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+
+
+class MemoryPort:
+    # Just enough of the serial.Serial API for DeviceInterface's receive path.
+    # Bytes are released in chunks, like an OS buffer filling between polls.
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.pos = 0
+        self.chunk_size = chunk_size
+        self.avail = 0
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        if(self.avail == self.pos):
+            self.avail = min(len(self.stream), self.pos + self.chunk_size)
+        return self.avail - self.pos
+
+    def read(self, size=1):
+        size = min(size, self.avail - self.pos)
+        data = self.stream[self.pos:self.pos + size]
+        self.pos += size
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+def make_stream(num_frames):
+    # Extended 8-byte frames, as the adapter emits them on a busy bus
+    stream = bytearray()
+    for i in range(num_frames):
+        stream += bytes([0x55, 0xAA, 0xE8])
+        stream += (i & 0x1FFFFFFF).to_bytes(4, 'little')
+        stream += bytes([(i + k) & 0xFF for k in range(8)])
+    return bytes(stream)
+
+
+def run(stream, use_bulk_read, chunk_size=4096):
+    dev = USBCanAnalyzerV7.DeviceInterface(use_bulk_read=use_bulk_read)
+    dev.sp = MemoryPort(stream, chunk_size)
+    dev.MAX_BYTES_PER_UPDATE = len(stream)
+
+    num_frames = 0
+    start = time.perf_counter()
+    while(dev.sp.pos < len(stream)):
+        num_frames += len(dev.receive())
+    elapsed = time.perf_counter() - start
+    return num_frames, elapsed
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    stream = make_stream(num_frames)
+
+    for label, bulk in (("byte-at-a-time", False), ("bulk read", True)):
+        frames, elapsed = run(stream, bulk)
+        print("%-16s %8d frames in %7.3f s  -> %10.0f frames/s, %6.2f MB/s" %
+              (label, frames, elapsed, frames / elapsed, len(stream) / elapsed / 1e6))
@@ -0,0 +1,45 @@
+# Serial.read() against the zero-copy Serial.readinto() on the POSIX backend.
+#
+# A pseudo terminal stands in for the adapter. Each round a chunk is written into the master
+# side and, once it is all pending, drained from the serial port on the slave side the way
+# DeviceInterface.rx_bulk_update() does it: one in_waiting-sized read. Only the read call is
+# timed. readinto() fills one preallocated buffer with no select() call, read() selects and
+# then allocates and copies new bytes objects every call.
+#
+# Usage: python benchmarks/bench_serial_readinto.py [num_reads] [chunk_bytes]   (Linux/macOS)
+
+import os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import serial
+
+
+def run(port, master_fd, num_reads, chunk_bytes, use_readinto):
+    block = (bytes(range(256)) * (chunk_bytes // 256 + 1))[:chunk_bytes]
+    buf = bytearray(chunk_bytes)
+    view = memoryview(buf)
+    read_time = 0.0
+    for _ in range(num_reads):
+        os.write(master_fd, block)
+        while(port.in_waiting < chunk_bytes):
+            pass
+        start = time.perf_counter()
+        if(use_readinto):
+            port.readinto(view)
+        else:
+            port.read(chunk_bytes)
+        read_time += time.perf_counter() - start
+    return read_time
+
+
+if __name__ == "__main__":
+    num_reads = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    chunk_bytes = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+
+    master_fd, slave_fd = os.openpty()
+    port = serial.Serial(os.ttyname(slave_fd), 2000000, timeout=1)
+    for label, use_readinto in (("read()", False), ("readinto()", True)):
+        read_time = run(port, master_fd, num_reads, chunk_bytes, use_readinto)
+        print("%-11s %d x %d bytes: %5.2f us per read, %6.1f MB/s" %
+              (label, num_reads, chunk_bytes, read_time / num_reads * 1e6, num_reads * chunk_bytes / read_time / 1e6))
+    port.close()
@@ -0,0 +1,46 @@
+# DeviceInterface.send() one frame at a time against send_many() for a burst of frames.
+#
+# A pseudo terminal stands in for the adapter, with a thread draining the master side.
+# send() pays for an encode, a select() and a write() per frame; send_many() encodes the
+# burst into one buffer and writes it TX_QUEUE_MAX_FRAMES frames at a time.
+#
+# Usage: python benchmarks/bench_tx_send_many.py [num_frames]   (Linux/macOS)
+
+import os, sys, time, threading
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+
+
+def drain(master_fd, stop):
+    while(not stop.is_set()):
+        os.read(master_fd, 65536)
+
+
+if __name__ == "__main__":
+    num_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+    master_fd, slave_fd = os.openpty()
+    stop = threading.Event()
+    drainer = threading.Thread(target=drain, args=(master_fd, stop), daemon=True)
+    drainer.start()
+
+    dev = USBCanAnalyzerV7.DeviceInterface(1024, True, os.ttyname(slave_fd),
+                                           serial_baud=USBCanAnalyzerV7.DeviceInterface.SERIAL_BAUD_HIGH_SPEED)
+    dev.open()
+    frames = [(seq, seq.to_bytes(8, 'little')) for seq in range(num_frames)]
+
+    start = time.perf_counter()
+    for can_id, data in frames:
+        dev.send(can_id, data)
+    send_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    dev.send_many(frames)
+    send_many_time = time.perf_counter() - start
+
+    for label, elapsed in (("send()", send_time), ("send_many()", send_many_time)):
+        print("%-12s %d frames: %6.2f us per frame, %8.0f frames/s" %
+              (label, num_frames, elapsed / num_frames * 1e6, num_frames / elapsed))
+    stop.set()
+    dev.close()
@@ -3,77 +3,524 @@ import tkinter.messagebox
 import tkinter.filedialog
 from tkinter import ttk
 import USBCanAnalyzerV7
-import Settings, Database
+import Settings, Database, CaptureFile, Export, Replay, SocketCan, IdFilter, MultiCapture, CyclicTx
 import datetime
+import logging
+import time
+import bisect
+import threading
+import argparse
 import os 
+import serial
+
+class MsgScrollback:
+    # Fixed capacity ring of the most recently received CanPackets. The message pane is drawn
+    # from here, so it needs O(1) access to the n-th newest message.
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.clear()
+
+    def clear(self):
+        self.buf = [None] * self.capacity
+        self.next_idx = 0
+        self.count = 0
+
+    def append(self, msg):
+        self.buf[self.next_idx] = msg
+        self.next_idx = (self.next_idx + 1) % self.capacity
+        if(self.count < self.capacity):
+            self.count += 1
+
+    def extend(self, msg_list):
+        for msg in msg_list:
+            self.append(msg)
+
+    def newest(self, age):
+        # age 0 is the newest message, age len-1 the oldest still held
+        return self.buf[(self.next_idx - 1 - age) % self.capacity]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # Oldest to newest
+        for age in range(self.count - 1, -1, -1):
+            yield self.newest(age)
+
+
+class IdStats:
+    # Running statistics for one CAN ID, for the overview pane. decoded is the database
+    # interpretation of last_msg, filled in by the receive stage.
+    __slots__ = ('last_msg', 'count', 'period_ns', 'avg_period_ns', 'changed', 'decoded')
+
+    # Weight of the newest period in the exponential average used for the rate
+    AVG_PERIOD_WEIGHT = 0.1
+
+    def __init__(self, msg):
+        self.last_msg = msg
+        self.count = 1
+        self.period_ns = 0
+        self.avg_period_ns = 0.0
+        self.changed = True
+        self.decoded = None
+
+    def update(self, msg):
+        self.period_ns = msg.rx_time_ns - self.last_msg.rx_time_ns
+        if(self.count == 1):
+            self.avg_period_ns = float(self.period_ns)
+        else:
+            self.avg_period_ns += (self.period_ns - self.avg_period_ns) * self.AVG_PERIOD_WEIGHT
+        self.last_msg = msg
+        self.count += 1
+        self.changed = True
+
+    def get_rate(self):
+        # Messages per second
+        if(self.avg_period_ns <= 0):
+            return 0.0
+        return 1e9 / self.avg_period_ns
+
+
+class IdOverview:
+    # Latest message and statistics per CAN ID. Work per message is one dict lookup, and
+    # the overview pane only redraws IDs that changed, so GUI cost depends on the number
+    # of distinct IDs rather than the bus load. IDs are kept apart per channel, so the
+    # keys are (channel, can_id).
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.stats = {}
+        self.sorted_ids = []
+        self.changed_ids = set()
+
+    def update(self, msg_list):
+        stats = self.stats
+        for msg in msg_list:
+            key = (msg.channel, msg.can_id)
+            id_stats = stats.get(key)
+            if(id_stats is None):
+                stats[key] = IdStats(msg)
+                bisect.insort(self.sorted_ids, key)
+            else:
+                id_stats.update(msg)
+            self.changed_ids.add(key)
+
+    def take_changed(self):
+        changed = self.changed_ids
+        self.changed_ids = set()
+        return changed
+
+
+class RxPipeline(threading.Thread):
+    # Receive stage, run off the Tk thread. Pulls messages from the CAN device, does the
+    # per-message bookkeeping (per-ID statistics, decoding the newest message of each ID for
+    # the overview pane), and queues them for the GUI. The GUI
+    # collects everything queued since its last paint with take_pending(), so each paint
+    # is one batched update. At most max_pending messages are held for the next paint;
+    # older ones past that are dropped from the display and counted in suppressed.
+
+    POLL_INTERVAL_S = 0.002
+
+    def __init__(self, can_device, id_overview, lock, max_pending, msg_db):
+        super().__init__()
+        self.daemon = True
+        self.candevice = can_device
+        self.id_overview = id_overview
+        self.lock = lock
+        self.max_pending = max_pending
+        self.msg_db = msg_db
+        self.pending = []
+        self.suppressed = 0
+        self.alive = True
+        # Last receive() failure, for the status bar. Cleared once messages arrive again.
+        self.error = None
+        # Software ID filter (IdFilter.IdFilter), applied before anything else looks at a message
+        self.id_filter = IdFilter.IdFilter()
+
+    def run(self):
+        while(self.alive):
+            try:
+                msg_list = self.candevice.receive()
+            except Exception as e:
+                msg_list = []
+                if(isinstance(e, (serial.SerialException, OSError)) and not self.candevice.is_open()):
+                    # Port was closed underneath us (Go Offline)
+                    logging.getLogger(__name__).debug("Receive failed: %s", e)
+                else:
+                    error = type(e).__name__ + ": " + str(e)
+                    if(error != self.error):
+                        # Once per distinct error, it would otherwise repeat every poll
+                        logging.getLogger(__name__).exception("Receive failed")
+                    self.error = error
+
+            if(len(msg_list) == 0):
+                time.sleep(self.POLL_INTERVAL_S)
+                continue
+
+            self.error = None
+            self.deliver(msg_list)
+
+    def push(self, msg_list):
+        # Inject messages as if they had been received
+        self.deliver(msg_list)
+
+    def deliver(self, msg_list):
+        msg_list = self.id_filter.filter(msg_list)
+        # Decode the newest message of each ID here rather than on the Tk thread
+        last_msgs = {}
+        for msg in msg_list:
+            last_msgs[(msg.channel, msg.can_id)] = msg
+        decoded = [(key, self.msg_db.decode(msg.can_id, msg.payload, msg.dlc)) for key, msg in last_msgs.items()]
+
+        with self.lock:
+            self.id_overview.update(msg_list)
+            stats = self.id_overview.stats
+            for key, msg_interpretation in decoded:
+                stats[key].decoded = msg_interpretation
+            self.pending.extend(msg_list)
+            excess = len(self.pending) - self.max_pending
+            if(excess > 0):
+                del self.pending[:excess]
+                self.suppressed += excess
+
+    def take_pending(self):
+        # Returns (messages since the last call, number suppressed since the last call)
+        with self.lock:
+            msg_list = self.pending
+            suppressed = self.suppressed
+            self.pending = []
+            self.suppressed = 0
+        return msg_list, suppressed
+
+    def set_id_filter(self, id_filter):
+        # Swapped in whole, so the receive loop never sees a half built filter
+        self.id_filter = id_filter
+
+    def stop(self):
+        self.alive = False
+        self.join(1)
+
 
 class CanViewGui:
 
+    # Max messages kept for scrolling back through. Older ones are dropped.
+    SCROLLBACK_MAX_MSGS = 100000
+
+    # Used to work out how many rows fit in the message pane
+    TREE_ROW_HEIGHT_PX = 20
+    TREE_HEADER_HEIGHT_PX = 25
+
+    EXPORT_FILETYPES = [('CSV file','*.csv'), ('Vector ASC log','*.asc'), ('candump log','*.log'), ('All files','*.*')]
+
+    # Max redraws per second of the per-ID overview pane
+    OVERVIEW_REFRESH_HZ = 10
+
+    # Redraws per second of the status bar and its receive statistics
+    STATUS_REFRESH_HZ = 2
+
+    # Paint rate of the render stage. The interval between paints stretches towards the
+    # minimum rate whenever a paint takes more than RENDER_MAX_LOAD of it.
+    RENDER_MAX_HZ = 30
+    RENDER_MIN_HZ = 5
+    RENDER_MAX_LOAD = 0.25
+
+    # Max new messages added to the display per paint, the rest are counted as suppressed
+    RENDER_FRAME_BUDGET = 20000
+
     # Menu Handlers
     def export_report(self):
-        file_save_str = ""
-        file_save_str += "time,id,data,\r\n"
-        for child in self.tree.get_children():
-            file_save_str +=self.tree.item(child)["text"] + "," + self.tree.item(child)["values"][0] + "," + self.tree.item(child)["values"][1] + "\r\n"
-            
-        f = tkinter.filedialog.asksaveasfile(mode='w', defaultextension='.csv', filetypes=[('CSV file','*.csv'), ('All files','*.*')], initialdir=os.getcwd(), title="Save Messages to CSV", initialfile='can_msg_log.csv')
-        if(f is None):
+        # Export the messages currently held in the scrollback
+        fname = tkinter.filedialog.asksaveasfilename(defaultextension='.csv', filetypes=self.EXPORT_FILETYPES, initialdir=os.getcwd(), title="Export Messages", initialfile='can_msg_log.csv')
+        if(not fname):
             return
-        f.write(file_save_str)
-        f.close()
-        return
+        packet_list = list(self.msg_log)
+        self.start_export(Export.packets_to_records(packet_list), fname, len(packet_list),
+                          self.candevice.capture_start_time, USBCanAnalyzerV7.WALL_CLOCK_OFFSET_NS, None)
+
+    def export_capture_log(self):
+        # Convert a recorded .cvlog capture to a text format
+        in_fname = tkinter.filedialog.askopenfilename(defaultextension='.cvlog', filetypes=[('Capture log','*.cvlog'), ('All files','*.*')], initialdir=os.getcwd(), title="Open Capture Log")
+        if(not in_fname):
+            return
+        try:
+            reader = CaptureFile.CaptureReader(in_fname)
+        except Exception as e:
+            tkinter.messagebox.showinfo("Error", "Could not open " + in_fname + ": " + str(e))
+            return
+        fname = tkinter.filedialog.asksaveasfilename(defaultextension='.csv', filetypes=self.EXPORT_FILETYPES, initialdir=os.getcwd(), title="Export Capture Log", initialfile='can_msg_log.csv')
+        if(not fname):
+            reader.close()
+            return
+        self.start_export(reader.iter_records(), fname, len(reader), reader.start_time_ns,
+                          reader.wall_time_ns - reader.start_time_ns, reader)
+
+    def start_export(self, records, fname, total_records, start_time_ns, wall_offset_ns, reader):
+        if(self.export_job is not None):
+            tkinter.messagebox.showinfo("Error", "An export is already running")
+            if(reader is not None):
+                reader.close()
+            return
+        ext = os.path.splitext(fname)[1].lower()
+        fmt = {'.asc':'asc', '.log':'candump'}.get(ext, 'csv')
+        self.export_job = Export.ExportJob(records, fname, fmt, start_time_ns, wall_offset_ns, total_records, self.msg_db)
+        self.export_reader = reader
+        self.export_job.start()
+        self.poll_export()
+
+    def cancel_export(self):
+        if(self.export_job is not None):
+            self.export_job.cancel()
+
+    def poll_export(self):
+        job = self.export_job
+        if(job.is_alive()):
+            self.export_status = "Exporting " + format(100 * (job.progress() or 0), '.0f') + "%"
+            self.update_status_bar()
+            self.master.after(200, self.poll_export)
+            return
+
+        if(self.export_reader is not None):
+            self.export_reader.close()
+        if(job.error is not None):
+            tkinter.messagebox.showinfo("Error", "Export failed: " + str(job.error))
+            self.export_status = ""
+        elif(job.cancelled):
+            self.export_status = "Export cancelled"
+        else:
+            self.export_status = "Exported " + str(job.records_done) + " messages"
+        self.export_job = None
+        self.export_reader = None
+        self.update_status_bar()
+
+    def start_recording(self):
+        fname = tkinter.filedialog.asksaveasfilename(defaultextension='.cvlog', filetypes=[('Capture log','*.cvlog'), ('All files','*.*')], initialdir=os.getcwd(), title="Record Capture Log", initialfile='can_capture.cvlog')
+        if(not fname):
+            return
+        self.candevice.start_capture_log(CaptureFile.CaptureWriter(fname, self.candevice.capture_start_time))
+        self.recording_fname = fname
+        self.update_status_bar()
+
+    def stop_recording(self):
+        self.candevice.stop_capture_log()
+        self.recording_fname = None
+        self.update_status_bar()
 
     def load_database(self):
         fname = tkinter.filedialog.askopenfilename( defaultextension='.xml', filetypes=[('Database XML file','*.xml'), ('All files','*.*')], initialdir=os.getcwd(), title="Open Database", initialfile='db.xml')
-        if(fname is None):
+        if(not fname):
+            # Cancelled: askopenfilename returns ''
             return
         else:
             self.msg_db.loadDb(fname)
         
         
     #Can message pane interaction
-    def insert_can_msg_display(self, time, id, can_data, name, subentries):
-        new_elem = self.tree.insert('', 0, text= str(time), values=(id, can_data,name))
-        for name in subentries:
-            datastr = "  ->" + name + " : " + subentries[name]
-            self.tree.insert(new_elem, 'end', text="", values=("","",datastr))
-        self.tree.counter = self.tree.counter + 1
+    # The pane is virtualized: the tree only ever holds one item per visible row. Messages
+    # live in self.msg_log, and render_can_msg_display() rewrites the visible rows from it,
+    # so GUI cost does not grow with the length of the capture.
+    def insert_can_msg_display(self, msg_list):
+        if(len(msg_list) == 0):
+            return
+        self.msg_log.extend(msg_list)
+        if(self.view_offset > 0):
+            # User has scrolled back, keep the same messages on screen
+            self.view_offset += len(msg_list)
+            self.clamp_view_offset()
+        self.view_dirty = True
 
     def clear_can_msg_display(self):
-        self.tree.delete(*self.tree.get_children()) 
+        self.msg_log.clear()
+        self.view_offset = 0
+        self.view_dirty = True
+        self.render_can_msg_display()
+        with self.display_lock:
+            self.id_overview.clear()
+        self.overview_tree.delete(*self.overview_tree.get_children())
+        self.suppressed_total = 0
+        self.update_status_bar()
+
+    def clamp_view_offset(self):
+        max_offset = max(0, len(self.msg_log) - self.view_rows)
+        self.view_offset = max(0, min(self.view_offset, max_offset))
+
+    def render_can_msg_display(self):
+        self.view_dirty = False
+        num_msgs = len(self.msg_log)
+        num_rows = max(0, min(self.view_rows, num_msgs - self.view_offset))
+
+        while(len(self.row_items) < num_rows):
+            self.row_items.append(self.tree.insert('', 'end', text=""))
+        while(len(self.row_items) > num_rows):
+            self.tree.delete(self.row_items.pop())
+
+        for row_idx, row_item in enumerate(self.row_items):
+            msg = self.msg_log.newest(self.view_offset + row_idx)
+            timestr = msg.get_rx_time_string()
+            msg_interpretation = self.msg_db.decode(msg.can_id, msg.payload, msg.dlc)
+            if(msg_interpretation != None):
+                name_str, values = msg_interpretation
+            else:
+                name_str, values = "", []
+
+            self.tree.item(row_item, text=timestr, values=(msg.channel, msg.get_id_string(), msg.get_data_string(), name_str))
+            self.tree.delete(*self.tree.get_children(row_item))
+            for elem_name, value in values:
+                datastr = "  ->" + elem_name + " : " + str(value)
+                self.tree.insert(row_item, 'end', text="", values=("","","",datastr))
+
+        if(num_msgs == 0):
+            self.vsb.set(0.0, 1.0)
+        else:
+            self.vsb.set(self.view_offset / num_msgs, (self.view_offset + num_rows) / num_msgs)
+
+    def handle_msg_scroll(self, *args):
+        # Scrollbar command callback: ('moveto', fraction) or ('scroll', amount, 'units'|'pages')
+        if(args[0] == 'moveto'):
+            self.view_offset = int(float(args[1]) * len(self.msg_log))
+        elif(args[0] == 'scroll'):
+            amount = int(args[1])
+            if(args[2] == 'pages'):
+                amount *= self.view_rows
+            self.view_offset += amount
+        self.clamp_view_offset()
+        self.render_can_msg_display()
+
+    def handle_msg_wheel(self, event):
+        if(event.num == 4 or event.delta > 0):
+            self.handle_msg_scroll('scroll', -3, 'units')
+        else:
+            self.handle_msg_scroll('scroll', 3, 'units')
+        return "break"
+
+    #Per-ID overview pane interaction
+    def render_overview_display(self):
+        self.last_overview_render = time.monotonic()
+        with self.display_lock:
+            changed = []
+            for key in self.id_overview.take_changed():
+                id_stats = self.id_overview.stats[key]
+                changed.append((key, id_stats, id_stats.last_msg, id_stats.decoded))
+            sorted_ids = list(self.id_overview.sorted_ids)
+        # In ID order, so every ID before a new row's position already has its row
+        changed.sort(key=lambda entry: entry[0])
+
+        for key, id_stats, msg, msg_interpretation in changed:
+            if(msg_interpretation != None):
+                name_str, values = msg_interpretation
+            else:
+                name_str, values = "", []
+
+            row_values = (msg.channel, msg.get_data_string(), id_stats.count, format(id_stats.get_rate(), '.1f'),
+                          format(id_stats.period_ns / 1e6, '.3f'), name_str)
+            row_item = "%d:%d" % key
+            if(self.overview_tree.exists(row_item)):
+                self.overview_tree.item(row_item, values=row_values)
+            else:
+                position = sorted_ids.index(key)
+                self.overview_tree.insert('', position, iid=row_item, text=msg.get_id_string(), values=row_values)
+
+            # Update decoded values in place where the rows already exist
+            sub_items = self.overview_tree.get_children(row_item)
+            if(len(sub_items) != len(values)):
+                self.overview_tree.delete(*sub_items)
+                sub_items = [self.overview_tree.insert(row_item, 'end', text="") for _ in values]
+            for sub_item, (elem_name, value) in zip(sub_items, values):
+                self.overview_tree.item(sub_item, values=("", "", "", "", "", "  ->" + elem_name + " : " + str(value)))
+
+    def set_view_mode(self):
+        if(self.view_mode.get() == 'overview'):
+            self.rxContainer.pack_forget()
+            self.overviewContainer.pack(side=BOTTOM, fill='both',expand=TRUE)
+            self.render_overview_display()
+        else:
+            self.overviewContainer.pack_forget()
+            self.rxContainer.pack(side=BOTTOM, fill='both',expand=TRUE)
+            self.render_can_msg_display()
+
+    def handle_msg_resize(self, event):
+        self.view_rows = max(1, (event.height - self.TREE_HEADER_HEIGHT_PX) // self.TREE_ROW_HEIGHT_PX)
+        self.clamp_view_offset()
+        self.render_can_msg_display()
 
     #CAN TX options interaction
     def handle_tx_press(self):
+        tx_entries = self.parse_tx_entries()
+        if(tx_entries is None):
+            return
+        self.candevice.send(*tx_entries)
+        return
+
+    def handle_cyclic_press(self):
+        # Send the ID/data every Period ms until Stop Cyclic is pressed
+        tx_entries = self.parse_tx_entries()
+        if(tx_entries is None):
+            return
+        try:
+            period_ms = float(self.periodEntry.get())
+        except:
+            tkinter.messagebox.showinfo("Error", "Period " + self.periodEntry.get() + " could not be parsed to a number" )
+            return
+        if(period_ms <= 0):
+            tkinter.messagebox.showinfo("Error", "Period must be more than 0 ms" )
+            return
+        self.cyclic_tx.add(int.from_bytes(tx_entries[0], byteorder='big'), tx_entries[1], period_ms)
+        return
+
+    def handle_cyclic_stop_press(self):
+        self.cyclic_tx.remove_all()
+
+    def parse_tx_entries(self):
+        # (id bytes, data bytes) from the TX pane, or None after telling the user what is wrong
         try:
             id_bytes=bytes.fromhex(self.idEntry.get())
         except:
             tkinter.messagebox.showinfo("Error", "ID " + self.idEntry.get() + " could not be parsed to a hexadecimal number" )
-            return
+            return None
 
         try:
             data_bytes=bytes.fromhex(self.dataEntry.get())
         except:
             tkinter.messagebox.showinfo("Error", "Data " + self.dataEntry.get() + " could not be parsed to a hexadecimal number" )
-            return
+            return None
 
-        self.candevice.send(id_bytes, data_bytes)
-        return
+        return (id_bytes, data_bytes)
 
     # Handle user change of settings
     def openSettings(self):
         #Open dialog to have user input new settings
         self.settings.openGUI(self.master)
+        self.apply_settings()
 
-        #Push those settings into the subclasses
+    def apply_settings(self):
+        #Push the settings into the subclasses
         self.candevice.set_config(int(self.settings.can_baud_rate),
-                                  bool(self.settings.can_use_extended_frame),
+                                  str(self.settings.can_use_extended_frame) == 'True',
                                   str(self.settings.can_serial_comport.split()[0]),
-                                  int(self.settings.can_serial_baud)
+                                  int(self.settings.can_serial_baud),
+                                  self.settings.get_filters()
         )
 
+    def openIdFilter(self):
+        self.settings.openFilterGUI(self.master)
+        self.apply_id_filter()
+
+    def apply_id_filter(self):
+        try:
+            id_filter = IdFilter.IdFilter(self.settings.id_filter_include, self.settings.id_filter_exclude)
+        except ValueError as e:
+            logging.getLogger(__name__).error("Ignoring saved ID filter: %s", e)
+            id_filter = IdFilter.IdFilter()
+        self.rx_pipeline.set_id_filter(id_filter)
+
     #Test Classes
     def insert_test_packet(self):
-        self.insert_can_msg_display("0.025","0x0C152A6F", "AA F0 B1 C5 89 6F 3D 4C", "My Message", {"val1": "25.9", "val2": "-34.3"})
+        test_msg = USBCanAnalyzerV7.CanPacket(self.candevice.capture_start_time, self.candevice.capture_start_time,
+                                              0x0C152A6F, 8, int.from_bytes(bytes.fromhex("AA F0 B1 C5 89 6F 3D 4C"), byteorder='little'),
+                                              USBCanAnalyzerV7.CanPacket.FLAG_EXTENDED)
+        self.rx_pipeline.push([test_msg])
 
 
     # Main Class
@@ -84,99 +531,210 @@ class CanViewGui:
 
         #settings module
         self.settings = Settings.Settings()
+        self.apply_settings()
 
         #database module
         self.msg_db = Database.dbProcessor()
 
+        #Received message storage backing the message pane
+        self.msg_log = MsgScrollback(self.SCROLLBACK_MAX_MSGS)
+        self.view_offset = 0
+        self.view_rows = 20
+        self.view_dirty = False
+        self.row_items = []
+
+        #Latest message per ID, for the overview pane
+        self.id_overview = IdOverview()
+        self.last_overview_render = 0.0
+        self.last_status_render = 0.0
+
+        #Receive stage running off the GUI thread. display_lock guards id_overview.
+        self.display_lock = threading.Lock()
+        self.rx_pipeline = RxPipeline(self.candevice, self.id_overview, self.display_lock, self.RENDER_FRAME_BUDGET, self.msg_db)
+        #Periodic transmit, from the TX pane's Send Cyclic button
+        self.cyclic_tx = CyclicTx.CyclicScheduler(self.candevice)
+        self.apply_id_filter()
+        self.render_interval_s = 1.0 / self.RENDER_MAX_HZ
+        self.suppressed_total = 0
+        self.recording_fname = None
+        self.export_job = None
+        self.export_reader = None
+        self.export_status = ""
+
         #Top-level GUI objects
         self.menubar = Menu(self.master)
         self.filemenu = Menu(self.menubar, tearoff=0)
+        self.viewmenu = Menu(self.menubar, tearoff=0)
         self.txContainer = Frame(self.master)
         self.rxContainer = Frame(self.master)
+        self.overviewContainer = Frame(self.master)
+        self.statusBar = Label(self.master, text="", anchor=W, relief=SUNKEN)
 
 
         #Top level file menu/options
         self.filemenu.add_command(label="Load Database", command=self.load_database)
         self.filemenu.add_command(label="Export Report", command=self.export_report)
+        self.filemenu.add_command(label="Export Capture Log", command=self.export_capture_log)
+        self.filemenu.add_command(label="Cancel Export", command=self.cancel_export)
+        self.filemenu.add_command(label="Start Recording", command=self.start_recording)
+        self.filemenu.add_command(label="Stop Recording", command=self.stop_recording)
         self.filemenu.add_separator()
         self.filemenu.add_command(label="Settings", command=self.openSettings)
+        self.filemenu.add_command(label="ID Filter", command=self.openIdFilter)
         self.filemenu.add_command(label="Test", command=self.insert_test_packet)
         self.filemenu.add_separator()
         self.filemenu.add_command(label="Exit", command=self.master.quit)
 
+        #View menu: scrolling log of every message, or one row per ID
+        self.view_mode = StringVar(self.master, value='log')
+        self.viewmenu.add_radiobutton(label="Message Log", variable=self.view_mode, value='log', command=self.set_view_mode)
+        self.viewmenu.add_radiobutton(label="Overview by ID", variable=self.view_mode, value='overview', command=self.set_view_mode)
+
         self.menubar.add_cascade(label="File", menu=self.filemenu)
+        self.menubar.add_cascade(label="View", menu=self.viewmenu)
         self.menubar.add_command(label="Go Online", command=self.candevice.open)
         self.menubar.add_command(label="Go Offline", command=self.candevice.close)
         self.menubar.add_command(label="Clear", command=self.clear_can_msg_display)
 
         #TX pane
         self.sendButtom = Button(self.txContainer, text="Send", command=self.handle_tx_press)
+        self.cyclicButton = Button(self.txContainer, text="Send Cyclic", command=self.handle_cyclic_press)
+        self.cyclicStopButton = Button(self.txContainer, text="Stop Cyclic", command=self.handle_cyclic_stop_press)
         self.idEntryContainer = Frame(self.txContainer)
         self.dataEntryContainer = Frame(self.txContainer)
+        self.periodEntryContainer = Frame(self.txContainer)
         self.idEntryLabel = Label(self.idEntryContainer, text="ID")
         self.dataEntryLabel = Label(self.dataEntryContainer, text="Data")
+        self.periodEntryLabel = Label(self.periodEntryContainer, text="Period (ms)")
         self.idEntry = Entry(self.idEntryContainer,width=10)
         self.dataEntry = Entry(self.dataEntryContainer, width=26)
+        self.periodEntry = Entry(self.periodEntryContainer, width=6)
+        self.periodEntry.insert(0, "100")
 
         #RX pane with treeview and scrollbar
         self.tree = ttk.Treeview(self.rxContainer)
-        self.vsb = ttk.Scrollbar(self.rxContainer, orient="vertical", command=self.tree.yview)
+        self.vsb = ttk.Scrollbar(self.rxContainer, orient="vertical", command=self.handle_msg_scroll)
 
-        self.tree.counter = 0
-        self.tree['columns'] = ('Time (s)', 'ID', 'Data')
+        self.tree['columns'] = ('Channel', 'ID', 'Data', 'Name')
         self.tree.heading('#0', text='Time', anchor=tkinter.CENTER)
-        self.tree.heading('#1', text='CAN ID', anchor=tkinter.CENTER)
-        self.tree.heading('#2', text='CAN Data', anchor=tkinter.CENTER)
-        self.tree.heading('#3', text='Name', anchor=tkinter.CENTER)
+        self.tree.heading('#1', text='Ch', anchor=tkinter.CENTER)
+        self.tree.heading('#2', text='CAN ID', anchor=tkinter.CENTER)
+        self.tree.heading('#3', text='CAN Data', anchor=tkinter.CENTER)
+        self.tree.heading('#4', text='Name', anchor=tkinter.CENTER)
         self.tree.column('#0', stretch=tkinter.YES, minwidth=85, width=85)
-        self.tree.column('#1', stretch=tkinter.YES, minwidth=85, width=85)
-        self.tree.column('#2', stretch=tkinter.YES, minwidth=170, width=170)
-        self.tree.column('#3', stretch=tkinter.YES, minwidth=130, width=130)
-        self.tree.configure(yscrollcommand=self.vsb.set)
+        self.tree.column('#1', stretch=tkinter.NO, minwidth=30, width=30)
+        self.tree.column('#2', stretch=tkinter.YES, minwidth=85, width=85)
+        self.tree.column('#3', stretch=tkinter.YES, minwidth=170, width=170)
+        self.tree.column('#4', stretch=tkinter.YES, minwidth=130, width=130)
+        self.tree.bind('<Configure>', self.handle_msg_resize)
+        self.tree.bind('<MouseWheel>', self.handle_msg_wheel)
+        self.tree.bind('<Button-4>', self.handle_msg_wheel)
+        self.tree.bind('<Button-5>', self.handle_msg_wheel)
+
+        #Overview pane with one row per ID
+        self.overview_tree = ttk.Treeview(self.overviewContainer)
+        self.overview_vsb = ttk.Scrollbar(self.overviewContainer, orient="vertical", command=self.overview_tree.yview)
+
+        self.overview_tree['columns'] = ('Channel', 'Data', 'Count', 'Rate', 'Period', 'Name')
+        self.overview_tree.heading('#0', text='CAN ID', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#1', text='Ch', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#2', text='Last Data', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#3', text='Count', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#4', text='Rate (msg/s)', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#5', text='Period (ms)', anchor=tkinter.CENTER)
+        self.overview_tree.heading('#6', text='Name', anchor=tkinter.CENTER)
+        self.overview_tree.column('#0', stretch=tkinter.YES, minwidth=85, width=85)
+        self.overview_tree.column('#1', stretch=tkinter.NO, minwidth=30, width=30)
+        self.overview_tree.column('#2', stretch=tkinter.YES, minwidth=170, width=170)
+        self.overview_tree.column('#3', stretch=tkinter.YES, minwidth=70, width=70)
+        self.overview_tree.column('#4', stretch=tkinter.YES, minwidth=85, width=85)
+        self.overview_tree.column('#5', stretch=tkinter.YES, minwidth=85, width=85)
+        self.overview_tree.column('#6', stretch=tkinter.YES, minwidth=130, width=130)
+        self.overview_tree.configure(yscrollcommand=self.overview_vsb.set)
 
         # LAYOUT
         self.master.config(menu=self.menubar)
 
         self.idEntryLabel.pack(side=LEFT, fill='none')
         self.dataEntryLabel.pack(side=LEFT, fill='none')
+        self.periodEntryLabel.pack(side=LEFT, fill='none')
         self.idEntry.pack(side=RIGHT, fill='none')
         self.dataEntry.pack(side=RIGHT, fill='none')
+        self.periodEntry.pack(side=RIGHT, fill='none')
         self.idEntryContainer.pack(side=LEFT, fill='y')
         self.dataEntryContainer.pack(side=LEFT, fill='y')
+        self.periodEntryContainer.pack(side=LEFT, fill='y')
+        self.cyclicStopButton.pack(side=RIGHT, fill='none')
+        self.cyclicButton.pack(side=RIGHT, fill='none')
         self.sendButtom.pack(side=RIGHT, fill='none')
         self.txContainer.pack(side=TOP, fill='none',expand=FALSE)
 
+        self.statusBar.pack(side=BOTTOM, fill='x')
         self.vsb.pack(side=RIGHT, fill='y')
         self.tree.pack(side=LEFT, fill='both',expand=TRUE)
+        self.overview_vsb.pack(side=RIGHT, fill='y')
+        self.overview_tree.pack(side=LEFT, fill='both',expand=TRUE)
         self.rxContainer.pack(side=BOTTOM, fill='both',expand=TRUE)
 
 
     def gui_run(self):
-        #Kick off the background update task
+        #Kick off the receive stage and the periodic render task
+        self.rx_pipeline.start()
+        self.cyclic_tx.start()
         self.periodic_update()
 
         #Kick off the gui. Blocks till closed.
         self.master.mainloop()
+        self.cyclic_tx.stop()
+        self.rx_pipeline.stop()
+        self.candevice.stop_capture_log()
         return
 
     def periodic_update(self):
-        msg_list = self.candevice.receive()
+        # Render stage: paint everything received since the last paint in one batch
+        paint_start = time.perf_counter()
 
-        for msg in msg_list:
-            timestr = str(msg.get_rx_time_delta_start().total_seconds())
-            msg_interpretation = self.msg_db.getInfo(msg.id, msg.data)
-            if(msg_interpretation != None):
-                name_str  = msg_interpretation['name']
-                data_dict = msg_interpretation['data']
-            else:
-                name_str  = ""
-                data_dict = {}
-                
-            self.insert_can_msg_display(timestr,msg.get_id_string(), msg.get_data_string(), name_str, data_dict)
+        msg_list, suppressed = self.rx_pipeline.take_pending()
+        self.insert_can_msg_display(msg_list)
 
-        self.master.after(10, self.periodic_update)
+        if(self.view_mode.get() == 'overview'):
+            if(time.monotonic() - self.last_overview_render >= 1.0 / self.OVERVIEW_REFRESH_HZ):
+                self.render_overview_display()
+        elif(self.view_dirty):
+            self.render_can_msg_display()
+
+        if(suppressed > 0):
+            self.suppressed_total += suppressed
+        if(time.monotonic() - self.last_status_render >= 1.0 / self.STATUS_REFRESH_HZ):
+            self.update_status_bar()
+
+        # Adapt the paint rate so painting never takes more than RENDER_MAX_LOAD of the time
+        paint_time = time.perf_counter() - paint_start
+        self.render_interval_s = min(1.0 / self.RENDER_MIN_HZ,
+                                     max(1.0 / self.RENDER_MAX_HZ, paint_time / self.RENDER_MAX_LOAD))
+
+        self.master.after(int(self.render_interval_s * 1000), self.periodic_update)
         return
 
+    def update_status_bar(self):
+        self.last_status_render = time.monotonic()
+        status_str = ""
+        if(self.rx_pipeline.error is not None):
+            status_str += "Receive error: " + self.rx_pipeline.error + "  "
+        if(self.candevice.rx_stats is not None):
+            status_str += self.candevice.rx_stats.summary() + "  "
+        cyclic_str = self.cyclic_tx.summary()
+        if(cyclic_str):
+            status_str += cyclic_str + "  "
+        if(self.recording_fname is not None):
+            status_str += "Recording to " + os.path.basename(self.recording_fname) + "  "
+        if(self.suppressed_total > 0):
+            status_str += str(self.suppressed_total) + " frames suppressed  "
+        if(self.rx_pipeline.id_filter.dropped > 0):
+            status_str += str(self.rx_pipeline.id_filter.dropped) + " frames filtered  "
+        status_str += self.export_status
+        self.statusBar.config(text=status_str)
+
 
 
 
@@ -184,8 +742,25 @@ class CanViewGui:
 # MAIN Code execution starts here
 #############################################################
 if __name__ == "__main__":
-    
-    interface = USBCanAnalyzerV7.DeviceInterface()
+
+    # Raise e.g. USBCanAnalyzerV7.set_trace_level('rx', logging.DEBUG) to trace received packets
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="CAN bus viewer for USB-CAN Analyzer V7 devices")
+    parser.add_argument('--replay', metavar='LOG', help="replay a recorded .cvlog, candump .log or exported .csv instead of using the device")
+    parser.add_argument('--socketcan', metavar='IFACE', help="use a Linux SocketCAN interface (e.g. can0, vcan0) instead of the USB adapter")
+    parser.add_argument('--ports', metavar='PORTS', help="capture from several adapters at once, e.g. COM5,COM6,COM7 (channels 0, 1, 2)")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed multiplier, 0 for as fast as possible (default 1)")
+    args = parser.parse_args()
+
+    if(args.replay is not None):
+        interface = Replay.ReplayInterface(args.replay, args.speed if args.speed > 0 else None)
+    elif(args.socketcan is not None):
+        interface = SocketCan.SocketCanInterface(args.socketcan)
+    elif(args.ports is not None):
+        interface = MultiCapture.MultiDeviceInterface(args.ports.split(','))
+    else:
+        interface = USBCanAnalyzerV7.DeviceInterface()
 
     my_gui = CanViewGui(Tk(), interface)
     my_gui.gui_run() 
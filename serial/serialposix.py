@@ -540,6 +540,61 @@ class Serial(SerialBase, PlatformSpecific):
                 break
         return bytes(read)
 
+    def readinto(self, b):
+        """\
+        Read up to len(b) bytes directly into the writable buffer b (e.g. a
+        memoryview of a preallocated bytearray) and return the number of bytes
+        read. Blocking and timeouts behave as in read(), but the data is not
+        copied through intermediate bytes objects. The port is non-blocking, so
+        the read is tried first and select() is only used to wait when nothing
+        is pending.
+        """
+        if not self.is_open:
+            raise portNotOpenError
+        if not hasattr(os, 'readv'):
+            return SerialBase.readinto(self, b)
+        view = memoryview(b).cast('B')
+        size = len(view)
+        num_read = 0
+        selected = False
+        timeout = Timeout(self._timeout)
+        while num_read < size:
+            try:
+                n = os.readv(self.fd, [view[num_read:]])
+            except OSError as e:
+                # ignore BlockingIOErrors and EINTR, other errors are shown
+                # https://www.python.org/dev/peps/pep-0475.
+                if e.errno not in (errno.EAGAIN, errno.EALREADY, errno.EWOULDBLOCK, errno.EINPROGRESS, errno.EINTR):
+                    raise SerialException('read failed: {}'.format(e))
+                n = None
+            if n:
+                num_read += n
+                selected = False
+                continue
+            if n == 0 and selected:
+                # Disconnected devices, at least on Linux, show the
+                # behavior that they are always ready to read immediately
+                # but reading returns nothing.
+                raise SerialException(
+                    'device reports readiness to read but returned no data '
+                    '(device disconnected or multiple access on port?)')
+            # nothing pending (VMIN is 0, so an empty read returns 0), wait for more
+            if timeout.is_non_blocking or timeout.expired():
+                break
+            try:
+                ready, _, _ = select.select([self.fd, self.pipe_abort_read_r], [], [], timeout.time_left())
+            except OSError as e:
+                if e.errno not in (errno.EAGAIN, errno.EALREADY, errno.EWOULDBLOCK, errno.EINPROGRESS, errno.EINTR):
+                    raise SerialException('read failed: {}'.format(e))
+                continue
+            if self.pipe_abort_read_r in ready:
+                os.read(self.pipe_abort_read_r, 1000)
+                break
+            if not ready:
+                break   # timeout
+            selected = True
+        return num_read
+
     def cancel_read(self):
         if self.is_open:
             os.write(self.pipe_abort_read_w, b"x")
@@ -794,6 +849,9 @@ class VTIMESerial(Serial):
     just ignore that.
     """
 
+    # the fd is blocking here, so readinto() goes through read() and the VTIME timeout
+    readinto = SerialBase.readinto
+
     def _reconfigure_port(self, force_update=True):
         """Set communication parameters on opened port."""
         super(VTIMESerial, self)._reconfigure_port()
@@ -0,0 +1,53 @@
+# AsyncBus tests against a pseudo terminal standing in for the adapter's serial port.
+#
+# Usage: python -m pytest tests
+
+import os, sys, asyncio, tty, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import AsyncCan
+
+CONFIG_PACKET_BYTES = 20
+
+
+def read_available(fd):
+    data = bytearray()
+    os.set_blocking(fd, False)
+    while(True):
+        try:
+            chunk = os.read(fd, 4096)
+        except BlockingIOError:
+            return bytes(data)
+        if(not chunk):
+            return bytes(data)
+        data += chunk
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), "needs a pseudo terminal")
+class AsyncBusTest(unittest.TestCase):
+
+    def setUp(self):
+        # Raw mode so the frame bytes reach the master side untouched. The slave end stays
+        # open, or the master reads EIO once the bus closes the port.
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.port_name = os.ttyname(self.slave_fd)
+
+    def tearDown(self):
+        os.close(self.slave_fd)
+        os.close(self.master_fd)
+
+    def test_close_sends_queued_frames(self):
+        async def send_then_close():
+            async with AsyncCan.AsyncBus(self.port_name) as bus:
+                await bus.send(0x123, b'\x01\x02')
+                await bus.send(0x456, b'')
+                return bus.device.encode_frame(0x123, b'\x01\x02') + bus.device.encode_frame(0x456, b'')
+
+        expected = asyncio.run(send_then_close())
+        written = read_available(self.master_fd)
+        self.assertEqual(written[CONFIG_PACKET_BYTES:], expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+# Capture log tests, recording a DeviceInterface on a loop:// port (the adapter's config
+# packet and any frames written to the port come straight back as received bytes).
+#
+# Usage: python -m pytest tests
+
+import os, sys, time, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+import CaptureFile
+
+
+def extended_frame(can_id, data):
+    return bytes([0x55, 0xAA, 0xE0 | len(data)]) + can_id.to_bytes(4, 'little') + bytes(data)
+
+
+class CaptureLogTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.fpath = tempfile.mkstemp(suffix='.cvlog')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.fpath)
+
+    def test_recording_started_before_open(self):
+        dev = USBCanAnalyzerV7.DeviceInterface(comport="loop://")
+        dev.start_capture_log(CaptureFile.CaptureWriter(self.fpath, dev.capture_start_time))
+        time.sleep(0.01)
+        dev.open()
+        try:
+            dev.sp.write(extended_frame(0x123, b'\x01\x02') + extended_frame(0x456, b'\x03'))
+            packet_list = []
+            deadline = time.perf_counter() + 1
+            while(len(packet_list) < 2 and time.perf_counter() < deadline):
+                packet_list += dev.receive()
+        finally:
+            dev.close()
+            dev.stop_capture_log()
+        self.assertEqual([packet.can_id for packet in packet_list], [0x123, 0x456])
+
+        reader = CaptureFile.CaptureReader(self.fpath)
+        try:
+            # The header follows open() resetting the time base, so it matches the packets
+            self.assertEqual(reader.start_time_ns, dev.capture_start_time)
+            self.assertEqual(reader.wall_time_ns, dev.capture_start_time + USBCanAnalyzerV7.WALL_CLOCK_OFFSET_NS)
+            logged = [reader.get_packet(idx) for idx in range(len(reader))]
+        finally:
+            reader.close()
+        self.assertEqual([(packet.can_id, packet.rx_time_ns) for packet in logged],
+                         [(packet.can_id, packet.rx_time_ns) for packet in packet_list])
+        self.assertEqual([packet.get_rx_time_string() for packet in logged],
+                         [packet.get_rx_time_string() for packet in packet_list])
+
+
+if __name__ == "__main__":
+    unittest.main()
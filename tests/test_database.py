@@ -0,0 +1,71 @@
+# Database decode tests: decode_batch() must agree with the scalar decode() path.
+#
+# Usage: python -m pytest tests
+
+import os, sys, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Database
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Two messages on the same ID told apart by data length, neither with a Name
+SAME_ID_DB = """<CanDatabase>
+  <Interpreter id_mask="0x7FF" id_compare="0x100" data_len="8">
+    <DataElem Name="A" Source="data" Mask="0xFF" Downshift="0" Scale="1" Offset="0"/>
+    <DataElem Name="B" Source="data" Mask="0xFF00" Downshift="8" Scale="0.5" Offset="-1"/>
+  </Interpreter>
+  <Interpreter id_mask="0x7FF" id_compare="0x100" data_len="2">
+    <DataElem Name="A" Source="data" Mask="0xFFFF" Downshift="0" Scale="2" Offset="0"/>
+  </Interpreter>
+  <Interpreter id_mask="0x700" id_compare="0x200" data_len="1">
+    <DataElem Name="Addr" Source="id" Mask="0xFF" Downshift="0" Scale="1" Offset="0"/>
+  </Interpreter>
+</CanDatabase>
+"""
+
+
+def load_db(xml):
+    with tempfile.NamedTemporaryFile('w', suffix='.xml', delete=False) as f:
+        f.write(xml)
+    try:
+        db = Database.dbProcessor()
+        db.loadDb(f.name)
+    finally:
+        os.unlink(f.name)
+    return db
+
+
+@unittest.skipIf(np is None, "decode_batch requires numpy")
+class DecodeBatchTest(unittest.TestCase):
+
+    def test_same_id_different_data_len(self):
+        db = load_db(SAME_ID_DB)
+        frames = [(0x100, 0x1234, 8), (0x100, 0x1234, 2), (0x2AB, 0, 1), (0x100, 0x5678, 8), (0x300, 0, 8)]
+        ids = np.array([f[0] for f in frames], dtype=np.uint32)
+        payloads = np.array([f[1] for f in frames], dtype=np.uint64)
+        data_lens = np.array([f[2] for f in frames])
+
+        match, signals = db.decode_batch(ids, payloads, data_lens)
+        self.assertEqual(match.tolist(), [0, 1, 2, 0, -1])
+
+        # Every value decode() gives appears in the signal for its interpreter, at its row
+        for row, (can_id, payload, data_len) in enumerate(frames):
+            decoded = db.decode(can_id, payload, data_len)
+            if(decoded is None):
+                continue
+            id_mask, id_compare, exp_data_len, _, _ = db.decodePlan[match[row]]
+            for elem_name, value in decoded[1]:
+                times, values = signals[(id_mask, id_compare, exp_data_len, elem_name)]
+                self.assertEqual(values[times.tolist().index(row)], value)
+
+        self.assertEqual(signals[(0x7FF, 0x100, 8, 'A')][1].tolist(), [0x34, 0x78])
+        self.assertEqual(signals[(0x7FF, 0x100, 2, 'A')][1].tolist(), [0x1234 * 2])
+        self.assertEqual(signals[(0x700, 0x200, 1, 'Addr')][1].tolist(), [0xAB])
+
+
+if __name__ == "__main__":
+    unittest.main()
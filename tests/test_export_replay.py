@@ -0,0 +1,58 @@
+# Export round trips: what Export writes, Replay reads back as the same records.
+#
+# Usage: python -m pytest tests
+
+import os, sys, shutil, tempfile, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import Export
+import Replay
+from USBCanAnalyzerV7 import CanPacket
+
+START_TIME_NS = 5000000000
+
+# (timestamp_ns, can_id, dlc, flags, channel, payload): an extended frame with a small ID,
+# a standard frame and an extended frame with an ID that needs more than 11 bits
+RECORDS = [
+    (START_TIME_NS + 1000, 0x123, 2, CanPacket.FLAG_EXTENDED, 0, 0x0201),
+    (START_TIME_NS + 2000, 0x123, 1, 0, 1, 0x05),
+    (START_TIME_NS + 3000, 0x18F00400, 0, CanPacket.FLAG_EXTENDED, 0, 0),
+]
+
+
+class ExportReplayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_csv_keeps_extended_flag(self):
+        fpath = os.path.join(self.tmp_dir, "log.csv")
+        Export.export_file(iter(RECORDS), fpath, 'csv', START_TIME_NS, 0)
+        self.assertEqual([record[1:] for record in Replay.read_csv(fpath)],
+                         [record[1:] for record in RECORDS])
+
+        # Re-exporting the replayed records keeps the candump ID format
+        candump_original = os.path.join(self.tmp_dir, "original.log")
+        candump_replayed = os.path.join(self.tmp_dir, "replayed.log")
+        Export.export_file(iter(RECORDS), candump_original, 'candump', START_TIME_NS, 0)
+        replayed = [(record[0] + START_TIME_NS,) + record[1:] for record in Replay.read_csv(fpath)]
+        Export.export_file(iter(replayed), candump_replayed, 'candump', START_TIME_NS, 0)
+        with open(candump_original) as f_original, open(candump_replayed) as f_replayed:
+            self.assertEqual(f_replayed.read(), f_original.read())
+
+    def test_csv_without_extended_column(self):
+        # Exports from before the column: extended is guessed from the ID
+        fpath = os.path.join(self.tmp_dir, "old.csv")
+        with open(fpath, 'w', newline='') as f:
+            f.write("time,channel,id,data,name,signals\r\n")
+            f.write("0.000001,0,0X123,01 02,,\r\n")
+            f.write("0.000002,0,0X18F00400,,,\r\n")
+        self.assertEqual([record[1:4] for record in Replay.read_csv(fpath)],
+                         [(0x123, 2, 0), (0x18F00400, 0, CanPacket.FLAG_EXTENDED)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# RX framer tests: the bulk and byte-at-a-time paths are fed the same adapter byte stream
+# from memory and must frame it the same way.
+#
+# Usage: python -m pytest tests
+
+import os, sys, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+from USBCanAnalyzerV7 import RxStats
+
+
+class MemoryPort:
+    # Just enough of the serial.Serial API for DeviceInterface's receive path
+    def __init__(self, stream):
+        self.stream = stream
+        self.pos = 0
+        self.is_open = True
+
+    @property
+    def in_waiting(self):
+        return len(self.stream) - self.pos
+
+    def read(self, size=1):
+        data = self.stream[self.pos:self.pos + size]
+        self.pos += len(data)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.is_open = False
+
+
+def extended_frame(can_id, data):
+    return bytes([0x55, 0xAA, 0xE0 | len(data)]) + can_id.to_bytes(4, 'little') + bytes(data)
+
+
+def receive_all(stream, use_bulk_read):
+    dev = USBCanAnalyzerV7.DeviceInterface(use_bulk_read=use_bulk_read)
+    dev.sp = MemoryPort(stream)
+    packet_list = []
+    while(dev.sp.in_waiting > 0):
+        packet_list += dev.receive()
+    return dev, packet_list
+
+
+class RxFramerTest(unittest.TestCase):
+
+    def test_dlc_over_8_is_a_bad_command(self):
+        # A 0xEF command byte claims 15 data bytes; it must be dropped, not framed
+        bad_frame = bytes([0x55, 0xAA, 0xEF]) + bytes(range(1, 20))
+        stream = extended_frame(0x123, b'\x01\x02') + bad_frame + extended_frame(0x456, b'\x03\x04\x05')
+        for use_bulk_read in (True, False):
+            with self.subTest(use_bulk_read=use_bulk_read):
+                dev, packet_list = receive_all(stream, use_bulk_read)
+                self.assertEqual([(packet.can_id, packet.data) for packet in packet_list],
+                                 [(0x123, b'\x01\x02'), (0x456, b'\x03\x04\x05')])
+                self.assertEqual(dev.rx_stats.errors[RxStats.ERR_BAD_COMMAND], 1)
+                self.assertEqual(dev.rx_stats.frames_parsed, 2)
+                for packet in packet_list:
+                    str(packet)
+
+
+if __name__ == "__main__":
+    unittest.main()
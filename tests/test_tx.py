@@ -0,0 +1,66 @@
+# Transmit path tests against a pseudo terminal standing in for the adapter's serial port,
+# with a thread draining the master side.
+#
+# Usage: python -m pytest tests
+
+import os, sys, time, threading, tty, unittest
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import USBCanAnalyzerV7
+
+
+@unittest.skipUnless(hasattr(os, 'openpty'), "needs a pseudo terminal")
+class PacedSendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)
+        self.written = bytearray()
+        self.stop = threading.Event()
+        self.drainer = threading.Thread(target=self.drain, daemon=True)
+        self.drainer.start()
+        self.dev = USBCanAnalyzerV7.DeviceInterface(1024, True, os.ttyname(self.slave_fd))
+        self.dev.open()
+        self.dev.tx_pace = True
+
+    def tearDown(self):
+        self.dev.close()
+        self.stop.set()
+        os.close(self.slave_fd)
+        self.drainer.join(1)
+        os.close(self.master_fd)
+
+    def drain(self):
+        while(not self.stop.is_set()):
+            try:
+                self.written += os.read(self.master_fd, 65536)
+            except OSError:
+                return
+
+    def test_send_not_held_up_by_paced_burst(self):
+        # About 0.3 s of bus time at 1 Mbit/s
+        frames = [(seq, seq.to_bytes(8, 'little')) for seq in range(2000)]
+        bus_time_s = len(frames) * USBCanAnalyzerV7.can_frame_bits(True, 8) * self.dev.bit_time_ns / 1e9
+
+        burst = threading.Thread(target=self.dev.send_many, args=(frames,))
+        start = time.perf_counter()
+        burst.start()
+        time.sleep(bus_time_s / 4)
+        send_start = time.perf_counter()
+        self.dev.send(0x1FFFFFFF, b'\xAA')
+        send_time_s = time.perf_counter() - send_start
+        burst.join()
+        burst_time_s = time.perf_counter() - start
+
+        # The burst is paced to the bus, the single frame goes out between two of its batches
+        self.assertGreater(burst_time_s, bus_time_s * 0.8)
+        self.assertLess(send_time_s, bus_time_s / 3)
+        time.sleep(0.1)
+        single_frame = self.dev.encode_frame(0x1FFFFFFF, b'\xAA')
+        self.assertEqual(self.written.count(single_frame), 1)
+        burst_bytes = b''.join(self.dev.encode_frame(can_id, data) for can_id, data in frames)
+        self.assertEqual(bytes(self.written).replace(single_frame, b'')[-len(burst_bytes):], burst_bytes)
+
+
+if __name__ == "__main__":
+    unittest.main()